@@ -1,39 +1,86 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, redirect, request, session, stream_with_context
 from flask_cors import CORS
 import requests
 import json
 import os
-from datetime import datetime, timedelta
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from breaks import breaks_bp
-import spotipy  # type: ignore
-from spotipy.oauth2 import SpotifyOAuth  # type: ignore
+import hashlib
+import secrets
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+from auth import auth_bp, current_user_id, resolve_user
+from breaks import BREAK_HISTORY, breaks_bp
+from cache import LRUCache, TTLCache
+from checkin_analytics import MAX_CHART_POINTS, analyze_checkins
+from checkin_store import CheckinStore
+from compaction import Compactor
+from fanout import FanOut, deadline_in
+from freebusy import FreeBusy
+from groq_client import GROQ_API_URL, GroqClient
+from integrations import DEFAULT_USER, IntegrationRegistry
+from jobs import JobQueue, JobQueueFull
+from model_router import MODEL_TIERS, ModelRouter, parse_task_tiers
+from models import db
+from scoring import StressScorer
+from singleflight import SingleFlight
 
 app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", "sqlite:///app.db")
+app.secret_key = os.getenv("SECRET_KEY")
+if not app.secret_key:
+    print(" SECRET_KEY is not set; sessions and tokens will not survive a restart")
+    app.secret_key = os.urandom(32)
+app.config['AUTH_TOKEN_MAX_AGE'] = int(os.getenv("AUTH_TOKEN_MAX_AGE", str(30 * 86400)))
+db.init_app(app)
+with app.app_context():
+    db.create_all()
 CORS(app)
+app.before_request(resolve_user)
+app.register_blueprint(auth_bp)
 app.register_blueprint(breaks_bp)
 
-checkin_data = {}
+checkin_store = CheckinStore(
+    app,
+    batch_size=int(os.getenv("CHECKIN_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("CHECKIN_FLUSH_INTERVAL", "1.0")),
+    hot_days=int(os.getenv("CHECKIN_HOT_DAYS", "30")),
+    max_users=int(os.getenv("CHECKIN_TIMELINE_USERS", "1024")),
+    rolling_days=int(os.getenv("CHECKIN_ROLLING_DAYS", "7")),
+    sync_lag=int(os.getenv("CHECKIN_SYNC_LAG", "300")),
+    catch_up_interval=float(os.getenv("CHECKIN_CATCH_UP_INTERVAL", "60")),
+    timeline_ttl=int(os.getenv("CHECKIN_TIMELINE_TTL", "900"))
+)
+BREAK_HISTORY.hot_days = int(os.getenv("BREAK_HOT_DAYS", "30"))
+
+compactor = Compactor(interval=float(os.getenv("COMPACTION_INTERVAL", "3600")), context=app.app_context)
+compactor.add("checkin", checkin_store.compact)
+compactor.add("break", BREAK_HISTORY.compact)
+compactor.start()
 
 # API Keys
 NOTION_API_KEY = os.getenv("NOTION_API_KEY")
 NOTION_DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+groq = GroqClient(
+    GROQ_API_KEY,
+    url=os.getenv("GROQ_API_URL", GROQ_API_URL),
+    requests_per_minute=int(os.getenv("GROQ_RPM", "30")),
+    tokens_per_minute=int(os.getenv("GROQ_TPM", "12000"))
+)
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 TOKEN_FILE = 'token_calendar.json'
+GOOGLE_API_ROOT_URL = os.getenv("GOOGLE_API_ROOT_URL")
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL")
 
-notion_headers = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Notion-Version": "2022-06-28",
-    "Content-Type": "application/json"
-}
+NOTION_TASK_WINDOW_DAYS = int(os.getenv("NOTION_TASK_WINDOW_DAYS", "7"))
+NOTION_DONE_STATUSES = [s.strip() for s in os.getenv("NOTION_DONE_STATUSES", "Done,Completed,Finished").split(",")]
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://127.0.0.1:5000/callback")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
 SPOTIFY_SCOPE = (
     "user-library-read "
     "user-top-read "
@@ -41,142 +88,198 @@ SPOTIFY_SCOPE = (
     "playlist-modify-private"
 )
 
-# ============= GOOGLE CALENDAR HELPERS =============
-def get_google_credentials():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        try:
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-            print(f"Loaded credentials from {TOKEN_FILE}")
-        except Exception as e:
-            print(f"Error loading credentials: {e}")
-            return None
-    
-    if creds and creds.expired and creds.refresh_token:
-        try:
-            print(" Token expired, refreshing...")
-            creds.refresh(Request())
-            with open(TOKEN_FILE, 'w') as token:
-                token.write(creds.to_json())
-            print("Token refreshed!")
-        except Exception as e:
-            print(f" Token refresh failed: {e}")
-            return None
-    elif creds and not creds.valid:
-        print(" Credentials invalid")
-        return None
-    return creds
+integrations = IntegrationRegistry({
+    "google_scopes": SCOPES,
+    "google_token_file": TOKEN_FILE,
+    "google_root_url": GOOGLE_API_ROOT_URL,
+    "notion_api_key": NOTION_API_KEY,
+    "notion_database_id": NOTION_DATABASE_ID,
+    "notion_window_days": NOTION_TASK_WINDOW_DAYS,
+    "notion_done_statuses": NOTION_DONE_STATUSES,
+    "notion_api_url": os.getenv("NOTION_API_URL"),
+    "spotify_client_id": SPOTIFY_CLIENT_ID,
+    "spotify_client_secret": SPOTIFY_CLIENT_SECRET,
+    "spotify_redirect_uri": SPOTIFY_REDIRECT_URI,
+    "spotify_scope": SPOTIFY_SCOPE,
+    "spotify_api_url": os.getenv("SPOTIFY_API_URL")
+}, maxsize=int(os.getenv("MAX_INTEGRATION_CLIENTS", "256")))
+# Pending Spotify logins: OAuth state -> user_id, consumed by /callback
+spotify_login_states = TTLCache(maxsize=4096, ttl=600)
+
+llm = ModelRouter(
+    groq,
+    tiers={
+        "small": os.getenv("GROQ_MODEL_SMALL", MODEL_TIERS["small"]),
+        "large": os.getenv("GROQ_MODEL_LARGE", MODEL_TIERS["large"])
+    },
+    task_tiers=parse_task_tiers(os.getenv("GROQ_TASK_TIERS")),
+    default_tier=os.getenv("GROQ_DEFAULT_TIER", "small")
+)
+
+STRESS_REQUIRED_FIELDS = ("stress_level", "stress_score", "burnout_risk")
+# Bump whenever the stress prompt changes so answers cached for the old prompt are not reused
+STRESS_PROMPT_VERSION = 1
+stress_analysis_cache = TTLCache(
+    maxsize=int(os.getenv("STRESS_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("STRESS_CACHE_TTL", "900"))
+)
+
+WELLNESS_SNAPSHOT_MAX_AGE = int(os.getenv("WELLNESS_SNAPSHOT_MAX_AGE", "60"))
+wellness_snapshots = LRUCache(int(os.getenv("WELLNESS_SNAPSHOT_USERS", "1024")))
+wellness_snapshots_by_id = LRUCache(int(os.getenv("WELLNESS_SNAPSHOT_USERS", "1024")))
+
+# Coalesces identical concurrent upstream fetches, keyed by (operation, user, inputs)
+flights = SingleFlight()
+UPSTREAM_DEADLINE = int(os.getenv("UPSTREAM_DEADLINE", "20"))
+fanout = FanOut(max_workers=int(os.getenv("FANOUT_WORKERS", "16")), context=app.app_context)
+
+JOB_WAIT_LIMIT = 30
+jobs = JobQueue(
+    max_workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", "64")),
+    retention=int(os.getenv("JOB_RETENTION", "3600")),
+    context=app.app_context
+)
+
+STRESS_AI_TIMEOUT = 30
+stress_scorer = StressScorer(json.loads(os.getenv("STRESS_SCORING_WEIGHTS") or "{}"))
+stress_enrichment_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STRESS_ENRICHMENT_WORKERS", "4")), thread_name_prefix="stress-ai"
+)
 
-def get_calendar_service():
+# ============= GOOGLE CALENDAR HELPERS =============
+def get_calendar_service(user_id=DEFAULT_USER):
     try:
-        creds = get_google_credentials()
-        if not creds:
-            return None
-        return build('calendar', 'v3', credentials=creds)
+        calendar = integrations.calendar(user_id)
+        return calendar.client.service() if calendar else None
     except Exception as e:
         print(f" Calendar service error: {e}")
         return None
 
-def fetch_calendar_events(days=7):
+def get_calendar_store(user_id=DEFAULT_USER):
+    calendar = integrations.calendar(user_id)
+    return calendar.store if calendar else None
+
+def fetch_calendar_events(days=7, user_id=DEFAULT_USER):
+    """Upcoming events; concurrent fetches for the same user and window share one sync"""
+    return flights.do(("calendar", user_id, days), sync_calendar_events, days, user_id)
+
+def sync_calendar_events(days, user_id):
     try:
-        service = get_calendar_service()
+        service = get_calendar_service(user_id)
         if not service:
             print(" Calendar not available")
             return []
         
-        now = datetime.utcnow()
-        time_min = now.isoformat() + 'Z'
-        time_max = (now + timedelta(days=days)).isoformat() + 'Z'
-        
-        print(f" Fetching events...")
-        events_result = service.events().list(
-            calendarId='primary', timeMin=time_min, timeMax=time_max,
-            singleEvents=True, orderBy='startTime', maxResults=100
-        ).execute()
+        store = get_calendar_store(user_id)
+        store.sync(service, days)
         
-        events = events_result.get('items', [])
-        parsed = []
-        for event in events:
-            start = event.get('start', {})
-            end = event.get('end', {})
-            parsed.append({
-                "id": event.get('id'),
-                "summary": event.get('summary', 'No Title'),
-                "description": event.get('description', ''),
-                "start": start.get('dateTime', start.get('date')),
-                "end": end.get('dateTime', end.get('date')),
-                "location": event.get('location', ''),
-                "attendees": len(event.get('attendees', [])),
-                "htmlLink": event.get('htmlLink', '')
-            })
+        now = datetime.now(timezone.utc)
+        parsed = store.events_between(now, now + timedelta(days=days))
         print(f" Fetched {len(parsed)} events")
         return parsed
     except Exception as e:
         print(f" Calendar fetch error: {e}")
         return []
 
-def insert_wellness_break_to_calendar(start_time, duration_minutes, break_type, reason):
-    try:
-        service = get_calendar_service()
-        if not service:
-            return {"success": False, "error": "Calendar unavailable"}
-        
-        end_time = start_time + timedelta(minutes=duration_minutes)
-        event = {
-            'summary': f'🧘 AI Wellness Break - {break_type.title()}',
-            'description': f'AI-suggested wellness break\n\nType: {break_type}\nReason: {reason}\n\n Auto-scheduled by Wellness Analyzer',
-            'start': {'dateTime': start_time.isoformat(), 'timeZone': 'Asia/Kolkata'},
-            'end': {'dateTime': end_time.isoformat(), 'timeZone': 'Asia/Kolkata'},
-            'colorId': '10',
-            'reminders': {
-                'useDefault': False,
-                'overrides': [{'method': 'popup', 'minutes': 5}, {'method': 'popup', 'minutes': 1}]
-            }
-        }
-        
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
-        print(f" Break inserted: {break_type} at {start_time.strftime('%H:%M')}")
-        
-        return {
-            "success": True,
-            "event_link": created_event.get('htmlLink'),
-            "event_id": created_event.get('id'),
-            "summary": created_event.get('summary'),
-            "start": start_time.isoformat(),
-            "end": end_time.isoformat()
+def build_wellness_break_event(start_time, duration_minutes, break_type, reason):
+    end_time = start_time + timedelta(minutes=duration_minutes)
+    return {
+        'summary': f'🧘 AI Wellness Break - {break_type.title()}',
+        'description': f'AI-suggested wellness break\n\nType: {break_type}\nReason: {reason}\n\n Auto-scheduled by Wellness Analyzer',
+        'start': {'dateTime': start_time.isoformat(), 'timeZone': 'Asia/Kolkata'},
+        'end': {'dateTime': end_time.isoformat(), 'timeZone': 'Asia/Kolkata'},
+        'colorId': '10',
+        'reminders': {
+            'useDefault': False,
+            'overrides': [{'method': 'popup', 'minutes': 5}, {'method': 'popup', 'minutes': 1}]
         }
-    except Exception as e:
-        print(f" Insert error: {e}")
-        return {"success": False, "error": str(e)}
+    }
+
+def inserted_break_result(created_event, start_time, duration_minutes):
+    return {
+        "success": True,
+        "event_link": created_event.get('htmlLink'),
+        "event_id": created_event.get('id'),
+        "summary": created_event.get('summary'),
+        "start": start_time.isoformat(),
+        "end": (start_time + timedelta(minutes=duration_minutes)).isoformat()
+    }
+
+CALENDAR_BATCH_LIMIT = 50
+
+def insert_wellness_breaks_to_calendar(breaks, user_id=DEFAULT_USER):
+    """Insert many breaks through the Calendar batch endpoint, one result per break in input order"""
+    service = get_calendar_service(user_id)
+    if not service:
+        return [{"success": False, "error": "Calendar unavailable"} for _ in breaks]
+    
+    results = [None] * len(breaks)
+    
+    def on_response(request_id, created_event, exception):
+        index = int(request_id)
+        if exception is not None:
+            print(f" Insert error: {exception}")
+            results[index] = {"success": False, "error": str(exception)}
+        else:
+            item = breaks[index]
+            results[index] = inserted_break_result(created_event, item['start_time'], item['duration_minutes'])
+    
+    for offset in range(0, len(breaks), CALENDAR_BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=on_response)
+        for index in range(offset, min(offset + CALENDAR_BATCH_LIMIT, len(breaks))):
+            item = breaks[index]
+            event = build_wellness_break_event(
+                item['start_time'], item['duration_minutes'], item['break_type'], item['reason']
+            )
+            batch.add(service.events().insert(calendarId='primary', body=event), request_id=str(index))
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f" Batch insert error: {e}")
+            for index in range(offset, min(offset + CALENDAR_BATCH_LIMIT, len(breaks))):
+                if results[index] is None:
+                    results[index] = {"success": False, "error": str(e)}
+    
+    print(f" Batch inserted {sum(1 for r in results if r and r.get('success'))}/{len(breaks)} breaks")
+    return results
 
 # ============= NOTION HELPERS =============
-def fetch_notion_tasks():
+def fetch_notion_tasks(user_id=DEFAULT_USER):
+    """Open Notion tasks; concurrent fetches for the same user share one query"""
+    return flights.do(("notion", user_id), sync_notion_tasks, user_id)
+
+def sync_notion_tasks(user_id):
     try:
+        notion = integrations.notion(user_id)
+        if not notion:
+            print("Notion not connected")
+            return []
         print(f"Fetching Notion tasks...")
-        response = requests.post(
-            f"https://api.notion.com/v1/databases/{NOTION_DATABASE_ID}/query",
-            headers=notion_headers, timeout=10
-        )
-        response.raise_for_status()
-        
-        tasks = []
-        for page in response.json().get("results", []):
-            props = page.get("properties", {})
-            task = {
-                "id": page.get("id"),
-                "name": props.get("Name", {}).get("title", [{}])[0].get("plain_text", "Untitled") if props.get("Name", {}).get("title") else "Untitled",
-                "due_date": props.get("Due date", {}).get("date", {}).get("start") if props.get("Due date", {}).get("date") else None,
-                "priority": props.get("Priority Level", {}).get("select", {}).get("name") if props.get("Priority Level", {}).get("select") else None,
-                "status": props.get("Status", {}).get("status", {}).get("name") if props.get("Status", {}).get("status") else None,
-                "type": props.get("Type", {}).get("rich_text", [{}])[0].get("plain_text") if props.get("Type", {}).get("rich_text") else None
-            }
-            tasks.append(task)
+        tasks = notion.store.sync({}, session=notion.session, base_url=notion.base_url)
         print(f"Fetched {len(tasks)} tasks")
         return tasks
     except Exception as e:
         print(f"Notion error: {e}")
         return []
 
+def list_notion_tasks(user_id=DEFAULT_USER):
+    """Every Notion task for the task list, not just the ones stress analysis reads"""
+    return flights.do(("notion-all", user_id), sync_notion_task_list, user_id)
+
+def sync_notion_task_list(user_id):
+    try:
+        notion = integrations.notion(user_id)
+        if not notion:
+            print("Notion not connected")
+            return []
+        tasks = notion.store.list_all({}, session=notion.session, base_url=notion.base_url)
+        print(f"Listed {len(tasks)} Notion tasks")
+        return tasks
+    except Exception as e:
+        print(f"Notion error: {e}")
+        return []
+
 def analyze_calendar_stress_patterns(events):
     stress_keywords = ['deadline', 'review', 'interview', 'presentation', 'demo', 'urgent', 
                        'critical', 'board', 'client', 'crisis', 'emergency', 'evaluation', 
@@ -188,36 +291,18 @@ def analyze_calendar_stress_patterns(events):
     total_hours = 0
     
     for i, event in enumerate(events):
-        summary = event.get('summary', '').lower()
-        desc = event.get('description', '').lower()
-        found_keywords = [kw for kw in stress_keywords if kw in summary or kw in desc]
+        found_keywords = [kw for kw in stress_keywords if kw in event.text]
         if found_keywords:
-            stress_events.append({'title': event.get('summary'), 'start': event.get('start'), 'keywords': found_keywords})
+            stress_events.append({'title': event.summary, 'start': event.start, 'keywords': found_keywords})
         
-        start_str = event.get('start')
-        end_str = event.get('end')
-        if start_str and end_str:
-            try:
-                start_dt = datetime.fromisoformat(start_str.replace('Z', '+00:00'))
-                end_dt = datetime.fromisoformat(end_str.replace('Z', '+00:00'))
-                duration_hours = (end_dt - start_dt).total_seconds() / 3600
-                total_hours += duration_hours
-                if duration_hours >= 2:
-                    long_meetings.append({'title': event.get('summary'), 'hours': round(duration_hours, 1)})
-            except:
-                pass
+        total_hours += event.duration_hours
+        if event.duration_hours >= 2:
+            long_meetings.append({'title': event.summary, 'hours': round(event.duration_hours, 1)})
         
         if i > 0:
-            prev_end = events[i-1].get('end')
-            curr_start = event.get('start')
-            if prev_end and curr_start:
-                try:
-                    prev_end_dt = datetime.fromisoformat(prev_end.replace('Z', '+00:00'))
-                    curr_start_dt = datetime.fromisoformat(curr_start.replace('Z', '+00:00'))
-                    if (curr_start_dt - prev_end_dt).total_seconds() <= 900:
-                        back_to_back += 1
-                except:
-                    pass
+            prev = events[i-1]
+            if not prev.all_day and not event.all_day and event.start_ts - prev.end_ts <= 900:
+                back_to_back += 1
     
     return {
         'total_events': len(events),
@@ -228,10 +313,15 @@ def analyze_calendar_stress_patterns(events):
         'total_hours': round(total_hours, 2)
     }
 
-def analyze_task_workload(tasks):
-    """PRECISE task workload analysis - ONLY UPCOMING 7 DAYS"""
+def analyze_task_workload(tasks, window_days=NOTION_TASK_WINDOW_DAYS, done_statuses=NOTION_DONE_STATUSES):
+    """PRECISE task workload analysis - ONLY tasks due in the next window_days
+
+    window_days and done_statuses are the ones the Notion query filters by,
+    so the local counts match the server-side predicate.
+    """
     now = datetime.now()
-    seven_days_from_now = now + timedelta(days=7)
+    window_end = now + timedelta(days=window_days)
+    done = {name.lower() for name in done_statuses}
     
     priority_counts = {'High': 0, 'Medium': 0, 'Low': 0}
     overdue = []
@@ -242,9 +332,9 @@ def analyze_task_workload(tasks):
     relevant_tasks = []
     
     for task in tasks:
-        status = task.get('status', '').lower()
+        status = (task.get('status') or '').lower()
         
-        if status in ['done', 'completed', 'finished']:
+        if status in done:
             continue
         
         due_date = task.get('due_date')
@@ -255,7 +345,7 @@ def analyze_task_workload(tasks):
         try:
             due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
             
-            if due_dt > seven_days_from_now.replace(tzinfo=due_dt.tzinfo):
+            if due_dt > window_end.replace(tzinfo=due_dt.tzinfo):
                 continue  
             
             relevant_tasks.append(task)
@@ -271,7 +361,7 @@ def analyze_task_workload(tasks):
                 urgent_24h.append(task)
             elif hours_until <= 72:
                 upcoming_3d.append(task)
-            elif hours_until <= 168:  # 7 days
+            else:  # rest of the window
                 upcoming_week.append(task)
                 
         except Exception as e:
@@ -281,6 +371,7 @@ def analyze_task_workload(tasks):
     incomplete = len(relevant_tasks)
     
     return {
+        'window_days': window_days,
         'total': len(tasks),  
         'relevant': len(relevant_tasks),  
         'by_priority': priority_counts,
@@ -294,31 +385,44 @@ def analyze_task_workload(tasks):
         'upcoming_week': upcoming_week,
         'upcoming_week_count': len(upcoming_week)
     }
-def comprehensive_stress_intelligence(calendar_events, notion_tasks):
-    """AI wellness expert with PRECISE and REALISTIC analysis"""
-    try:
-        cal_analysis = analyze_calendar_stress_patterns(calendar_events)
-        task_analysis = analyze_task_workload(notion_tasks)
-        
-       
-        task_details = []
-        for task in task_analysis['overdue']:
-            task_details.append(f"OVERDUE: {task.get('name')} (Priority: {task.get('priority', 'None')})")
-        for task in task_analysis['urgent_24h']:
-            task_details.append(f"URGENT (24h): {task.get('name')} (Priority: {task.get('priority', 'None')})")
-        for task in task_analysis['upcoming_3d']:
-            task_details.append(f"DUE SOON (3d): {task.get('name')} (Priority: {task.get('priority', 'None')})")
-        
-        task_summary = "\n".join(task_details[:10]) if task_details else "No urgent tasks in the next 7 days"
-        
-       
-        prompt = f"""You are an expert AI wellness psychologist. Analyze this person's workload PRECISELY and REALISTICALLY.
+def stress_cache_key(cal_analysis, task_analysis, task_details):
+    """Content hash of everything the stress prompt is built from"""
+    compact = {
+        "model": llm.model_for("stress_analysis"),
+        "prompt_version": STRESS_PROMPT_VERSION,
+        "calendar": {
+            k: cal_analysis[k] for k in ('total_events', 'back_to_back', 'stress_count', 'total_hours')
+        },
+        "long_meetings": len(cal_analysis['long_meetings']),
+        "tasks": {
+            k: task_analysis[k] for k in ('window_days', 'total', 'relevant', 'overdue_count', 'urgent_count', 'upcoming_count', 'by_priority')
+        },
+        "task_details": task_details[:10]
+    }
+    return hashlib.sha256(json.dumps(compact, sort_keys=True).encode()).hexdigest()
+
+def stress_task_details(task_analysis):
+    task_details = []
+    for task in task_analysis['overdue']:
+        task_details.append(f"OVERDUE: {task.get('name')} (Priority: {task.get('priority', 'None')})")
+    for task in task_analysis['urgent_24h']:
+        task_details.append(f"URGENT (24h): {task.get('name')} (Priority: {task.get('priority', 'None')})")
+    for task in task_analysis['upcoming_3d']:
+        task_details.append(f"DUE SOON (3d): {task.get('name')} (Priority: {task.get('priority', 'None')})")
+    return task_details
+
+def build_stress_payload(cal_analysis, task_analysis, task_details):
+    """Groq request for the stress analysis prompt"""
+    window = f"next {task_analysis['window_days']} days"
+    task_summary = "\n".join(task_details[:10]) if task_details else f"No urgent tasks in the {window}"
+
+    prompt = f"""You are an expert AI wellness psychologist. Analyze this person's workload PRECISELY and REALISTICALLY.
 
 IMPORTANT: Be REALISTIC with stress scores. Don't overestimate. Most people function fine with moderate workload.
 
-TASK ANALYSIS (Next 7 days ONLY):
-- Total tasks in Notion: {task_analysis['total']}
-- Relevant tasks (next 7 days, incomplete): {task_analysis['relevant']}
+TASK ANALYSIS ({window.capitalize()} ONLY):
+- Open tasks fetched from Notion: {task_analysis['total']}
+- Relevant tasks ({window}, incomplete): {task_analysis['relevant']}
 - Overdue: {task_analysis['overdue_count']} tasks
 - Urgent (next 24h): {task_analysis['urgent_count']} tasks  
 - Due Soon (next 3d): {task_analysis['upcoming_count']} tasks
@@ -395,152 +499,242 @@ Return ONLY valid JSON:
   "detailed_assessment": "Explain the score based on ACTUAL numbers. Be specific about why this score was chosen."
 }}"""
 
-        headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-        payload = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": [
-                {"role": "system", "content": "You are an expert wellness psychologist. Be PRECISE and REALISTIC. Don't inflate stress scores. Return ONLY valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1,  
-            "max_tokens": 2000,
-            "response_format": {"type": "json_object"}
-        }
-        
-        print(" Calling Groq AI for precise stress analysis...")
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        
-        analysis = json.loads(response.json()["choices"][0]["message"]["content"])
-        analysis["raw_metrics"] = {
-            "calendar": cal_analysis,
-            "tasks": task_analysis
-        }
-        
-        print(f" Analysis complete! Stress: {analysis['stress_score']}/10 ({analysis['stress_level']})")
-        print(f"  Relevant tasks: {task_analysis['relevant']} (Overdue: {task_analysis['overdue_count']}, Urgent: {task_analysis['urgent_count']})")
-        print(f"  Calendar events: {cal_analysis['total_events']}")
-        
-        return analysis
-        
-    except Exception as e:
-        print(f" Analysis error: {e}")
-        
-        task_analysis = analyze_task_workload(notion_tasks)
-        cal_analysis = analyze_calendar_stress_patterns(calendar_events)
-        stress_score = 1
-        if task_analysis['relevant'] <= 5:
-            stress_score += 1
-        elif task_analysis['relevant'] <= 10:
-            stress_score += 2
-        elif task_analysis['relevant'] <= 15:
-            stress_score += 3
-        else:
-            stress_score += 4
-        stress_score += min(task_analysis['overdue_count'] * 1.5, 3)
-        stress_score += min(task_analysis['urgent_count'], 2)
-        if cal_analysis['total_events'] >= 20:
-            stress_score += 2
-        elif cal_analysis['total_events'] >= 10:
-            stress_score += 1
-        if cal_analysis['back_to_back'] >= 5:
-            stress_score += 1
-        
-        stress_score = min(int(stress_score), 10)
-        
-        stress_levels_map = {
-            (1, 2): "minimal",
-            (3, 4): "low",
-            (5, 6): "moderate",
-            (7, 8): "high",
-            (9, 9): "severe",
-            (10, 10): "critical"
-        }
-        
-        stress_level = "moderate"
-        for (min_s, max_s), level in stress_levels_map.items():
-            if min_s <= stress_score <= max_s:
-                stress_level = level
-                break
-        
-        return {
-            "stress_level": stress_level,
-            "stress_score": stress_score,
-            "burnout_risk": "high" if stress_score >= 8 else "moderate" if stress_score >= 5 else "low",
-            "mood_state": "overwhelmed" if stress_score >= 9 else "stressed" if stress_score >= 7 else "coping" if stress_score >= 5 else "balanced",
-            "energy_forecast": "depleted" if stress_score >= 9 else "low" if stress_score >= 7 else "moderate" if stress_score >= 5 else "stable",
-            "key_patterns": [
-                f"{task_analysis['relevant']} tasks in next 7 days",
-                f"{cal_analysis['total_events']} calendar events"
-            ],
-            "wellness_recommendations": [
-                {"action": "Review task priorities", "priority": "high" if task_analysis['overdue_count'] > 2 else "medium", "reasoning": f"{task_analysis['overdue_count']} overdue tasks"}
-            ],
-            "recommended_music_genres": ["chill", "ambient", "lo-fi"],
-            "detailed_assessment": f"Based on {task_analysis['relevant']} relevant tasks (next 7 days) and {cal_analysis['total_events']} events. {task_analysis['overdue_count']} overdue, {task_analysis['urgent_count']} urgent.",
-            "error": str(e),
-            "raw_metrics": {
-                "calendar": cal_analysis,
-                "tasks": task_analysis
-            }
-        }
+    return {
+        "model": llm.model_for("stress_analysis"),
+        "messages": [
+            {"role": "system", "content": "You are an expert wellness psychologist. Be PRECISE and REALISTIC. Don't inflate stress scores. Return ONLY valid JSON."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.1,  
+        "max_tokens": 2000,
+        "response_format": {"type": "json_object"}
+    }
 
+def fallback_stress_analysis(cal_analysis, task_analysis, error):
+    """Rule-based stress estimate used when the AI analysis is unavailable"""
+    return dict(stress_scorer.score(cal_analysis, task_analysis), error=str(error))
 
-def intelligent_break_scheduler(calendar_events, notion_tasks, stress_analysis, checkin_intel):
+def valid_stress_analysis(analysis):
     try:
-        now = datetime.now()
-        today = now.date()
+        return 1 <= float(analysis['stress_score']) <= 10
+    except (TypeError, ValueError):
+        return False
+
+def ai_stress_analysis(cal_analysis, task_analysis):
+    """Groq assessment of precomputed metrics, served from the cache while the inputs are unchanged"""
+    task_details = stress_task_details(task_analysis)
+    cache_key = stress_cache_key(cal_analysis, task_analysis, task_details)
+    cached = stress_analysis_cache.get(cache_key)
+    if cached is not None:
+        print(f" Stress analysis cache hit ({cache_key[:12]})")
+        return cached
+
+    payload = build_stress_payload(cal_analysis, task_analysis, task_details)
+    print(" Calling Groq AI for precise stress analysis...")
+    analysis = llm.chat_json(
+        "stress_analysis", payload, timeout=STRESS_AI_TIMEOUT,
+        required=STRESS_REQUIRED_FIELDS, validate=valid_stress_analysis
+    )
+    stress_analysis_cache.put(cache_key, analysis)
+    return analysis
+
+def cached_ai_stress_analysis(cal_analysis, task_analysis):
+    task_details = stress_task_details(task_analysis)
+    return stress_analysis_cache.get(stress_cache_key(cal_analysis, task_analysis, task_details))
+
+def fetch_wellness_sources(user_id=DEFAULT_USER, deadline=None):
+    """Calendar events and Notion tasks, fetched concurrently"""
+    fetched = fanout.run({
+        "calendar_events": (fetch_calendar_events, 7, user_id),
+        "notion_tasks": (fetch_notion_tasks, user_id)
+    }, deadline or deadline_in(UPSTREAM_DEADLINE), defaults={"calendar_events": [], "notion_tasks": []})
+    return fetched["calendar_events"], fetched["notion_tasks"]
+
+def get_wellness_snapshot(user_id=DEFAULT_USER, max_age=None, refresh=False):
+    """Calendar events, Notion tasks and stress analysis for a user, reused while younger than max_age seconds
+
+    A new snapshot is scored by the local rule engine and returned straight away;
+    the AI assessment replaces it in the background once Groq answers.
+    """
+    snapshot = None if refresh else fresh_wellness_snapshot(user_id, max_age)
+    if snapshot:
+        print(f" Reusing wellness snapshot for {user_id} ({snapshot_age(snapshot)}s old)")
+        return snapshot
+
+    return flights.do(("snapshot", user_id), build_wellness_snapshot, user_id)
+
+def build_wellness_snapshot(user_id):
+    calendar_events, notion_tasks = fetch_wellness_sources(user_id)
+    cal_analysis = analyze_calendar_stress_patterns(calendar_events)
+    task_analysis = analyze_task_workload(notion_tasks)
+    snapshot = store_wellness_snapshot(
+        user_id, calendar_events, notion_tasks, stress_scorer.score(cal_analysis, task_analysis)
+    )
+    enrich_wellness_snapshot(snapshot, cal_analysis, task_analysis)
+    return snapshot
+
+def store_wellness_snapshot(user_id, calendar_events, notion_tasks, stress_analysis, ai_status="pending"):
+    snapshot = {
+        "id": uuid.uuid4().hex,
+        "user_id": user_id,
+        "calendar_events": calendar_events,
+        "notion_tasks": notion_tasks,
+        "stress_analysis": stress_analysis,
+        "ai_status": ai_status,
+        "ai_future": None,
+        "generated_at": datetime.now().isoformat(),
+        "created": time.monotonic()
+    }
+    wellness_snapshots.put(user_id, snapshot)
+    wellness_snapshots_by_id.put(snapshot['id'], snapshot)
+    return snapshot
+
+def fresh_wellness_snapshot(user_id, max_age=None):
+    """Cached snapshot for a user if it is younger than max_age seconds, else None"""
+    max_age = WELLNESS_SNAPSHOT_MAX_AGE if max_age is None else max_age
+    snapshot = wellness_snapshots.get(user_id)
+    if snapshot and time.monotonic() - snapshot['created'] <= max_age:
+        return snapshot
+    return None
+
+def attach_ai_analysis(snapshot, analysis):
+    raw_metrics = snapshot['stress_analysis'].get('raw_metrics')
+    snapshot['stress_analysis'] = dict(analysis, source="ai", raw_metrics=raw_metrics)
+    snapshot['ai_status'] = "ready"
+
+def enrich_wellness_snapshot(snapshot, cal_analysis, task_analysis):
+    """Attach the Groq assessment to a snapshot, in the background unless it is already cached"""
+    cached = cached_ai_stress_analysis(cal_analysis, task_analysis)
+    if cached is not None:
+        attach_ai_analysis(snapshot, cached)
+        return
+
+    def enrich():
+        try:
+            attach_ai_analysis(snapshot, ai_stress_analysis(cal_analysis, task_analysis))
+            print(f" AI analysis attached to snapshot {snapshot['id'][:8]}")
+        except Exception as e:
+            print(f" Background analysis error: {e}")
+            snapshot['stress_analysis'] = dict(snapshot['stress_analysis'], error=str(e))
+            snapshot['ai_status'] = "failed"
 
-        work_start = datetime.combine(today, datetime.min.time()).replace(hour=9)
-        work_end = datetime.combine(today, datetime.min.time()).replace(hour=18)
+    snapshot['ai_future'] = stress_enrichment_pool.submit(enrich)
 
-        today_events = [
-            e for e in calendar_events
-            if e.get('start', '').startswith(today.isoformat())
-        ]
-        today_events.sort(key=lambda x: x.get('start', ''))
+def wait_for_ai_analysis(snapshot, timeout):
+    """Block until the snapshot's AI assessment settles or timeout seconds pass"""
+    future = snapshot.get('ai_future')
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeout:
+            pass
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_wellness_analysis(user_id=DEFAULT_USER, max_age=None, refresh=False):
+    """Server-sent events for /analyze/stream: metrics first, then Groq tokens, then the final analysis"""
+    snapshot = None if refresh else fresh_wellness_snapshot(user_id, max_age)
+    if snapshot:
+        analysis = snapshot['stress_analysis']
+        yield sse_event("metrics", {"raw_metrics": analysis.get('raw_metrics', {}), "snapshot": snapshot_info(snapshot)})
+        yield sse_event("analysis", analysis)
+        yield sse_event("done", {"cached": True, "snapshot": snapshot_info(snapshot)})
+        return
+
+    calendar_events, notion_tasks = fetch_wellness_sources(user_id)
+    cal_analysis = analyze_calendar_stress_patterns(calendar_events)
+    task_analysis = analyze_task_workload(notion_tasks)
+    raw_metrics = {"calendar": cal_analysis, "tasks": task_analysis}
+    yield sse_event("metrics", {
+        "raw_metrics": raw_metrics,
+        "data_sources": {
+            "calendar_events": len(calendar_events),
+            "notion_tasks_total": len(notion_tasks),
+            "notion_tasks_relevant": task_analysis['relevant']
+        }
+    })
 
-        available_slots = []
-        current_time = max(now, work_start)
-
-        for event in today_events:
-            try:
-                event_start = datetime.fromisoformat(
-                    event['start'].replace('Z', '+00:00')
-                )
-                gap_minutes = (event_start - current_time).total_seconds() / 60
-
-                if gap_minutes >= 20:
-                    available_slots.append({
-                        "start": current_time.strftime("%H:%M"),
-                        "end": event_start.strftime("%H:%M"),
-                        "gap_minutes": int(gap_minutes),
-                        "context": f"Before {event.get('summary', 'next event')}"
-                    })
+    task_details = stress_task_details(task_analysis)
+    cache_key = stress_cache_key(cal_analysis, task_analysis, task_details)
+    analysis = stress_analysis_cache.get(cache_key)
+    cached = analysis is not None
+    if not cached:
+        payload = build_stress_payload(cal_analysis, task_analysis, task_details)
+        # Groq's JSON mode cannot be streamed, so the object is extracted from the text instead
+        stream_payload = {k: v for k, v in payload.items() if k != "response_format"}
+        deadline = time.monotonic() + STRESS_AI_TIMEOUT
+        content = []
+        try:
+            for delta in llm.stream_chat("stress_analysis", stream_payload, timeout=STRESS_AI_TIMEOUT):
+                content.append(delta)
+                yield sse_event("token", {"content": delta})
+            analysis = llm.parse_streamed(
+                "stress_analysis", "".join(content), payload, timeout=max(1.0, deadline - time.monotonic()),
+                required=STRESS_REQUIRED_FIELDS, validate=valid_stress_analysis
+            )
+            stress_analysis_cache.put(cache_key, analysis)
+        except Exception as e:
+            print(f" Streaming analysis error: {e}")
+            analysis = fallback_stress_analysis(cal_analysis, task_analysis, e)
 
-                event_end = datetime.fromisoformat(
-                    event['end'].replace('Z', '+00:00')
-                )
-                current_time = event_end
-            except:
-                continue
+    ai_status = "failed" if "error" in analysis else "ready"
+    analysis = dict(analysis, raw_metrics=raw_metrics)
+    if ai_status == "ready":
+        analysis["source"] = "ai"
+    snapshot = store_wellness_snapshot(user_id, calendar_events, notion_tasks, analysis, ai_status)
+    yield sse_event("analysis", analysis)
+    yield sse_event("done", {"cached": cached, "snapshot": snapshot_info(snapshot)})
 
-        if current_time < work_end:
-            gap_minutes = (work_end - current_time).total_seconds() / 60
-            if gap_minutes >= 15:
-                available_slots.append({
-                    "start": current_time.strftime("%H:%M"),
-                    "end": work_end.strftime("%H:%M"),
-                    "gap_minutes": int(gap_minutes),
-                    "context": "End of workday"
-                })
+def snapshot_age(snapshot):
+    return round(time.monotonic() - snapshot['created'], 1)
+
+def snapshot_request_args(args):
+    """(max_age, refresh) freshness controls from query parameters"""
+    return args.get('max_age', type=int), args.get('refresh', 'false').lower() == 'true'
+
+def snapshot_info(snapshot):
+    return {
+        "id": snapshot['id'],
+        "generated_at": snapshot['generated_at'],
+        "age_seconds": snapshot_age(snapshot),
+        "ai_status": snapshot['ai_status']
+    }
+
+
+def filled_confidence(*keys):
+    """Confidence function scoring an answer 0 when any of keys is empty, else no opinion"""
+    def confidence(result):
+        return 0.0 if any(result.get(key) in ("", [], {}) for key in keys) else None
+    return confidence
+
+def break_schedule_confidence(schedule):
+    """Mean confidence the model reported for its suggested breaks"""
+    scores = []
+    for item in schedule.get('recommended_breaks') or []:
+        try:
+            scores.append(float(item.get('confidence')))
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return sum(scores) / len(scores) if scores else None
+
+def intelligent_break_scheduler(calendar_events, notion_tasks, stress_analysis, checkin_intel, freebusy=None):
+    try:
+        if freebusy is None:
+            freebusy = FreeBusy.from_events(calendar_events)
+
+        available_slots = []
+        for gap_start, gap_end, next_event in freebusy.free_slots(days=1, min_minutes=15):
+            gap_minutes = (gap_end - gap_start) / 60
+            if next_event is not None and gap_minutes < 20:
+                continue
+            available_slots.append({
+                "start": datetime.fromtimestamp(gap_start).strftime("%H:%M"),
+                "end": datetime.fromtimestamp(gap_end).strftime("%H:%M"),
+                "gap_minutes": int(gap_minutes),
+                "context": f"Before {next_event}" if next_event is not None else "End of workday"
+            })
 
-        
         prompt = f"""
         You are an AI wellness coach inside a mobile wellness app.
         Your goal is to intelligently schedule wellness breaks that feel helpful,
@@ -610,13 +804,7 @@ def intelligent_break_scheduler(calendar_events, notion_tasks, stress_analysis,
 
 
 
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
-            "model": "llama-3.3-70b-versatile",
             "messages": [
                 {"role": "system", "content": "Return ONLY valid JSON. No explanations."},
                 {"role": "user", "content": prompt}
@@ -626,16 +814,11 @@ def intelligent_break_scheduler(calendar_events, notion_tasks, stress_analysis,
             "response_format": {"type": "json_object"}
         }
 
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=25
+        return llm.chat_json(
+            "break_schedule", payload, timeout=25,
+            required=("recommended_breaks",), confidence=break_schedule_confidence
         )
 
-        response.raise_for_status()
-        return json.loads(response.json()["choices"][0]["message"]["content"])
-
     except Exception as e:
         print(f" Break scheduler error: {e}")
         now = datetime.now()
@@ -652,46 +835,39 @@ def intelligent_break_scheduler(calendar_events, notion_tasks, stress_analysis,
             "daily_strategy": "Keep things light and balanced"
         }
 
-def save_checkin(user_id, checkin_type, data):
-    if user_id not in checkin_data:
-        checkin_data[user_id] = {
-            'morning': [],
-            'afternoon': [],
-            'evening': []
-        }
-
-    checkin_entry = {
-        'timestamp': datetime.now().isoformat(),
-        'type': checkin_type,
-        'data': data,
-        'signals': {
-            'stress': data.get('stress', 5),
-            'energy': data.get('energy', 5),
-            'mood': data.get('mood', 5),
-            'focus': data.get('focus', None)
-        }
-    }
-
-    checkin_data[user_id][checkin_type].append(checkin_entry)
+class InvalidCheckin(ValueError):
+    pass
 
-    cutoff = datetime.now() - timedelta(days=30)
-    checkin_data[user_id][checkin_type] = [
-        c for c in checkin_data[user_id][checkin_type]
-        if datetime.fromisoformat(c['timestamp']) > cutoff
-    ]
+def checkin_level(data, key, default=5):
+    """A 1-10 check-in rating from the request body, or InvalidCheckin"""
+    value = data.get(key, default)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise InvalidCheckin(f"'{key}' must be a number from 1 to 10")
+    try:
+        level = round(float(value))
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidCheckin(f"'{key}' must be a number from 1 to 10")
+    if not 1 <= level <= 10:
+        raise InvalidCheckin(f"'{key}' must be a number from 1 to 10")
+    return level
 
-    return checkin_entry
-def derive_checkin_intelligence(checkins, days=7):
-    cutoff = datetime.now() - timedelta(days=days)
+def save_checkin(user_id, checkin_type, data):
+    signals = {
+        'stress': checkin_level(data, 'stress'),
+        'energy': checkin_level(data, 'energy'),
+        'mood': checkin_level(data, 'mood'),
+        'focus': data.get('focus', None)
+    }
+    return checkin_store.add(user_id, checkin_type, data, signals)
 
-    flattened = []
-    for period in ['morning', 'afternoon', 'evening']:
-        flattened.extend([
-            c for c in checkins.get(period, [])
-            if datetime.fromisoformat(c['timestamp']) > cutoff
-        ])
+def get_checkin_intelligence(user_id):
+    """Stress, energy and burnout signals for the rolling window, read from the store's running totals"""
+    return intelligence_from_totals(checkin_store.rolling_totals(user_id))
 
-    if not flattened:
+def intelligence_from_totals(totals):
+    if not totals["count"]:
         return {
             "avg_stress": 5,
             "avg_energy": 5,
@@ -699,21 +875,13 @@ def derive_checkin_intelligence(checkins, days=7):
             "burnout_risk": "low"
         }
 
-    stress_vals = [c['signals']['stress'] for c in flattened]
-    energy_vals = [c['signals']['energy'] for c in flattened]
-
-    afternoon_energy = [
-        c['signals']['energy']
-        for c in checkins.get('afternoon', [])
-        if datetime.fromisoformat(c['timestamp']) > cutoff
-    ]
-
-    avg_stress = round(sum(stress_vals) / len(stress_vals), 1)
-    avg_energy = round(sum(energy_vals) / len(energy_vals), 1)
+    avg_stress = round(totals["stress_sum"] / totals["count"], 1)
+    avg_energy = round(totals["energy_sum"] / totals["count"], 1)
 
+    afternoon = totals["periods"]["afternoon"]
     afternoon_slump = (
-        len(afternoon_energy) >= 2 and
-        sum(afternoon_energy) / len(afternoon_energy) <= 4
+        afternoon["count"] >= 2 and
+        afternoon["energy_sum"] / afternoon["count"] <= 4
     )
 
     burnout_risk = (
@@ -730,19 +898,10 @@ def derive_checkin_intelligence(checkins, days=7):
     }
 
 def get_recent_checkins(user_id, days=7):
-    if user_id not in checkin_data:
-        return {'morning': [], 'afternoon': [], 'evening': []}
-    cutoff = datetime.now() - timedelta(days=days)
-    return {
-        'morning': [c for c in checkin_data[user_id]['morning'] if datetime.fromisoformat(c['timestamp']) > cutoff],
-        'afternoon': [c for c in checkin_data[user_id]['afternoon'] if datetime.fromisoformat(c['timestamp']) > cutoff],
-        'evening': [c for c in checkin_data[user_id]['evening'] if datetime.fromisoformat(c['timestamp']) > cutoff]
-    }
+    return checkin_store.range(user_id, datetime.now() - timedelta(days=days))
 
-def analyze_mood_with_ai(checkin_history, current_checkin):
+def analyze_mood_with_ai(checkin_history, current_checkin, intelligence):
     try:
-        intelligence = derive_checkin_intelligence(checkin_history, days=7)
-
         mood_summary = []
         for period in ['morning', 'afternoon', 'evening']:
             for c in checkin_history.get(period, [])[-5:]:
@@ -783,13 +942,7 @@ Return ONLY valid JSON:
 }}
 """
 
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
-            "model": "llama-3.3-70b-versatile",
             "messages": [
                 {"role": "system", "content": "Return ONLY JSON."},
                 {"role": "user", "content": prompt}
@@ -799,15 +952,8 @@ Return ONLY valid JSON:
             "response_format": {"type": "json_object"}
         }
 
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-
-        response.raise_for_status()
-        return json.loads(response.json()["choices"][0]["message"]["content"])
+        return llm.chat_json("mood_analysis", payload, timeout=30, required=("mood_state", "mood_score"),
+                             confidence=filled_confidence("mood_state"))
 
     except Exception as e:
         return {
@@ -828,22 +974,98 @@ def home():
         "service": " Wellness Analyzer v2.0", "status": "running",
         "endpoints": {
             "GET /calendar": "Calendar events", "GET /tasks": "Notion tasks",
-            "GET /analyze": "AI stress analysis", "GET /schedule-breaks": "Break scheduler",
+            "GET /analyze": "AI stress analysis", "GET /analyze/<snapshot_id>": "Stress analysis by snapshot",
+            "GET /analyze/stream": "Streaming stress analysis (SSE)",
+            "GET /schedule-breaks": "Break scheduler",
             "POST /checkin/morning": "Morning check-in", "POST /checkin/afternoon": "Afternoon check-in",
             "POST /checkin/evening": "Evening check-in", "GET /checkin/history": "Check-in history",
-            "GET /checkin/status": "Today's check-in status", "GET /checkin/analytics": "Check-in analytics"
+            "GET /checkin/status": "Today's check-in status", "GET /checkin/analytics": "Check-in analytics",
+            "GET /jobs/<job_id>": "Background job result"
         }
     })
 
+@app.route("/llm/stats")
+def llm_stats():
+    """Groq latency, retry and token usage per call site since startup, plus check-in write stats"""
+    return jsonify({
+        "success": True,
+        "groq": groq.usage_stats(),
+        "tiers": llm.stats(),
+        "singleflight": {"upstream": flights.stats(), "groq": groq.inflight.stats()},
+        "checkins": checkin_store.stats()
+    })
+
 @app.route("/calendar")
 def get_calendar():
     days = request.args.get('days', 7, type=int)
-    events = fetch_calendar_events(days)
-    return jsonify({"success": True, "total": len(events), "events": events})
+    user_id = current_user_id()
+    events = fetch_calendar_events(days, user_id)
+    return jsonify({"success": True, "total": len(events), "events": [e.to_dict() for e in events]})
+
+@app.route("/calendar/watch", methods=["POST", "DELETE"])
+def calendar_watch():
+    """Register or stop the push channel that keeps the local calendar mirror fresh
+
+    Notifications always go to the configured CALENDAR_WEBHOOK_URL; callers
+    cannot choose where Google posts them.
+    """
+    try:
+        user_id = current_user_id()
+        if request.method == "POST" and not CALENDAR_WEBHOOK_URL:
+            return jsonify({"success": False, "error": "No webhook address configured"}), 503
+        service = get_calendar_service(user_id)
+        if not service:
+            return jsonify({"success": False, "error": "Calendar unavailable"}), 503
+        store = get_calendar_store(user_id)
+
+        if request.method == "DELETE":
+            channel = store.stop_watch(service)
+            if channel:
+                integrations.unwatch_channel(channel['id'])
+            return jsonify({"success": True, "stopped": bool(channel)})
+
+        if store.channel:
+            replaced = store.stop_watch(service)
+            if replaced:
+                integrations.unwatch_channel(replaced['id'])
+        channel = store.watch(service, CALENDAR_WEBHOOK_URL)
+        integrations.watch_channel(channel['id'], user_id)
+        return jsonify({
+            "success": True,
+            "channel_id": channel['id'],
+            "expiration": datetime.fromtimestamp(channel['expiration']).isoformat()
+        })
+    except Exception as e:
+        print(f" Calendar watch error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/calendar/webhook", methods=["POST"])
+def calendar_webhook():
+    """Receiver for Google Calendar push notifications"""
+    channel_id = request.headers.get('X-Goog-Channel-ID')
+    user_id = integrations.channel_user(channel_id)
+    if user_id is None:
+        return jsonify({"success": False, "error": "Unknown channel"}), 404
+
+    calendar = integrations.clients.get((user_id, 'calendar'))
+    if calendar is None:
+        # Evicted between the channel lookup and here; a fresh mirror starts with a full sync anyway
+        return "", 204
+
+    resource_state = request.headers.get('X-Goog-Resource-State')
+    accepted = calendar.store.handle_notification(
+        channel_id, request.headers.get('X-Goog-Channel-Token'), resource_state
+    )
+    if not accepted:
+        return jsonify({"success": False, "error": "Unknown channel"}), 404
+    if resource_state != 'sync':
+        # The next analysis for this user must see the changed calendar
+        wellness_snapshots.pop(user_id)
+    return "", 204
 
 @app.route("/tasks")
 def get_tasks():
-    tasks = fetch_notion_tasks()
+    tasks = list_notion_tasks(current_user_id())
     return jsonify({"success": True, "total": len(tasks), "tasks": tasks})
 
 @app.route("/analyze")
@@ -853,18 +1075,23 @@ def analyze():
     print(" COMPREHENSIVE WELLNESS ANALYSIS")
     print("="*70)
     
-    calendar_events = fetch_calendar_events(7)
-    notion_tasks = fetch_notion_tasks()
+    user_id = current_user_id()
+    max_age, refresh = snapshot_request_args(request.args)
+    snapshot = get_wellness_snapshot(user_id, max_age, refresh)
+    if request.args.get('sync', 'false').lower() == 'true':
+        wait_for_ai_analysis(snapshot, STRESS_AI_TIMEOUT)
+    calendar_events = snapshot['calendar_events']
+    notion_tasks = snapshot['notion_tasks']
     
     print(f"\nCalendar: {len(calendar_events)} events")
     print(f"Notion: {len(notion_tasks)} total tasks")
     
-    stress_analysis = comprehensive_stress_intelligence(calendar_events, notion_tasks)
+    stress_analysis = snapshot['stress_analysis']
     
     # Log the filtered results
     task_metrics = stress_analysis.get('raw_metrics', {}).get('tasks', {})
     print(f"\n Filtered Analysis:")
-    print(f"   Relevant tasks (next 7 days): {task_metrics.get('relevant', 0)}")
+    print(f"   Relevant tasks (next {task_metrics.get('window_days', NOTION_TASK_WINDOW_DAYS)} days): {task_metrics.get('relevant', 0)}")
     print(f"   Overdue: {task_metrics.get('overdue_count', 0)}")
     print(f"   Urgent (24h): {task_metrics.get('urgent_count', 0)}")
     print(f"   Due soon (3d): {task_metrics.get('upcoming_count', 0)}")
@@ -879,25 +1106,56 @@ def analyze():
             "calendar_events": len(calendar_events),
             "notion_tasks_total": len(notion_tasks),
             "notion_tasks_relevant": task_metrics.get('relevant', 0)
-        }
+        },
+        "snapshot": snapshot_info(snapshot)
+    })
+
+@app.route("/analyze/<snapshot_id>")
+def analyze_result(snapshot_id):
+    """Stress analysis of an earlier snapshot, with the AI assessment once it has arrived"""
+    snapshot = wellness_snapshots_by_id.get(snapshot_id)
+    if snapshot is None or snapshot['user_id'] != current_user_id():
+        return jsonify({"success": False, "error": "Unknown or expired snapshot"}), 404
+
+    wait = min(request.args.get('wait', 0, type=float), STRESS_AI_TIMEOUT)
+    if wait > 0:
+        wait_for_ai_analysis(snapshot, wait)
+    return jsonify({
+        "success": True,
+        "stress_intelligence": snapshot['stress_analysis'],
+        "snapshot": snapshot_info(snapshot)
     })
+
+@app.route("/analyze/stream")
+def analyze_stream():
+    """Stress analysis as server-sent events: raw metrics right away, AI output as it is generated"""
+    user_id = current_user_id()
+    max_age, refresh = snapshot_request_args(request.args)
+    return Response(
+        stream_with_context(stream_wellness_analysis(user_id, max_age, refresh)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route("/schedule-breaks")
 def schedule_breaks():
     try:
         print("\nINTELLIGENT BREAK SCHEDULING\n")
-        user_id = request.args.get("user_id", "default_user")
-        recent_checkins = get_recent_checkins(user_id, days=7)
-        checkin_intel = derive_checkin_intelligence(recent_checkins)
+        user_id = current_user_id()
+        checkin_intel = get_checkin_intelligence(user_id)
 
-        calendar_events = fetch_calendar_events(7)
-        notion_tasks = fetch_notion_tasks()
-        stress_analysis = comprehensive_stress_intelligence(calendar_events, notion_tasks)
+        snapshot = get_wellness_snapshot(user_id, *snapshot_request_args(request.args))
+        calendar_events = snapshot['calendar_events']
+        notion_tasks = snapshot['notion_tasks']
+        stress_analysis = snapshot['stress_analysis']
+        calendar_store = get_calendar_store(user_id)
 
         break_schedule = intelligent_break_scheduler(
             calendar_events,
             notion_tasks,
             stress_analysis, 
-            checkin_intel
+            checkin_intel,
+            freebusy=calendar_store.freebusy() if calendar_store else None
         )
 
         auto_insert = request.args.get('auto_insert', 'false').lower() == 'true'
@@ -905,6 +1163,7 @@ def schedule_breaks():
 
         if auto_insert:
             print("Auto-inserting breaks into Google Calendar...")
+            pending_breaks = []
             for rec in break_schedule.get('recommended_breaks', []):
                 try:
                     time_slot = rec.get('time_slot', '')
@@ -919,19 +1178,21 @@ def schedule_breaks():
                         microsecond=0
                     )
 
-                    result = insert_wellness_break_to_calendar(
-                        start_time=start_time,
-                        duration_minutes=rec.get('duration_minutes', 10),
-                        break_type=rec.get('break_type', 'wellness'),
-                        reason=rec.get('reasoning', 'AI-recommended')
-                    )
+                    pending_breaks.append({
+                        "start_time": start_time,
+                        "duration_minutes": rec.get('duration_minutes', 10),
+                        "break_type": rec.get('break_type', 'wellness'),
+                        "reason": rec.get('reasoning', 'AI-recommended')
+                    })
 
+                except Exception as e:
+                    print(f"   ✗ Skipping break with invalid time slot: {e}")
+
+            if pending_breaks:
+                for item, result in zip(pending_breaks, insert_wellness_breaks_to_calendar(pending_breaks, user_id)):
                     if result.get('success'):
                         inserted_breaks.append(result)
-                        print(f"   ✓ Inserted: {rec.get('break_type')} at {start_time_str}")
-
-                except Exception as e:
-                    print(f"   ✗ Failed to insert break: {e}")
+                        print(f"   ✓ Inserted: {item['break_type']} at {item['start_time'].strftime('%H:%M')}")
 
             print(f"\nSuccessfully inserted {len(inserted_breaks)} breaks\n")
 
@@ -950,21 +1211,37 @@ def schedule_breaks():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def run_mood_analysis(user_id, checkin_input):
+    return analyze_mood_with_ai(get_recent_checkins(user_id, 7), checkin_input, get_checkin_intelligence(user_id))
+
+def checkin_response(user_id, saved_checkin, checkin_input):
+    """Acknowledge a saved check-in and queue its mood analysis as a background job"""
+    try:
+        job = jobs.submit("mood_analysis", run_mood_analysis, user_id, checkin_input, user_id=user_id)
+    except JobQueueFull as e:
+        print(f" Mood analysis not queued: {e}")
+        return jsonify({"success": True, "checkin": saved_checkin, "job": None, "job_error": str(e)})
+    return jsonify({
+        "success": True,
+        "checkin": saved_checkin,
+        "job": job.to_dict(),
+        "job_url": f"/jobs/{job.id}"
+    }), 202
+
 @app.route("/checkin/morning", methods=["POST"])
 def morning_checkin():
     try:
         data = request.json
-        user_id = data.get('user_id', 'default_user')
+        user_id = current_user_id()
         checkin_input = {
-            'mood': data.get('mood', 5), 'energy': data.get('energy', 5),
-            'sleep_quality': data.get('sleep_quality', 5), 'stress': data.get('stress', 5),
+            'mood': checkin_level(data, 'mood'), 'energy': checkin_level(data, 'energy'),
+            'sleep_quality': data.get('sleep_quality', 5), 'stress': checkin_level(data, 'stress'),
             'notes': data.get('notes', ''), 'goals': data.get('goals', [])
         }
         saved_checkin = save_checkin(user_id, 'morning', checkin_input)
-        history = get_recent_checkins(user_id, 7)
-        all_checkins = history['morning'] + history['afternoon'] + history['evening']
-        mood_analysis = analyze_mood_with_ai(all_checkins, checkin_input)
-        return jsonify({"success": True, "checkin": saved_checkin, "mood_analysis": mood_analysis})
+        return checkin_response(user_id, saved_checkin, checkin_input)
+    except InvalidCheckin as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -972,17 +1249,16 @@ def morning_checkin():
 def afternoon_checkin():
     try:
         data = request.json
-        user_id = data.get('user_id', 'default_user')
+        user_id = current_user_id()
         checkin_input = {
-            'mood': data.get('mood', 5), 'energy': data.get('energy', 5),
-            'stress': data.get('stress', 5), 'focus': data.get('focus', 5),
+            'mood': checkin_level(data, 'mood'), 'energy': checkin_level(data, 'energy'),
+            'stress': checkin_level(data, 'stress'), 'focus': checkin_level(data, 'focus'),
             'notes': data.get('notes', '')
         }
         saved_checkin = save_checkin(user_id, 'afternoon', checkin_input)
-        history = get_recent_checkins(user_id, 7)
-        all_checkins = history['morning'] + history['afternoon'] + history['evening']
-        mood_analysis = analyze_mood_with_ai(all_checkins, checkin_input)
-        return jsonify({"success": True, "checkin": saved_checkin, "mood_analysis": mood_analysis})
+        return checkin_response(user_id, saved_checkin, checkin_input)
+    except InvalidCheckin as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -990,23 +1266,31 @@ def afternoon_checkin():
 def evening_checkin():
     try:
         data = request.json
-        user_id = data.get('user_id', 'default_user')
+        user_id = current_user_id()
         checkin_input = {
-            'mood': data.get('mood', 5), 'energy': data.get('energy', 5),
-            'stress': data.get('stress', 5), 'productivity': data.get('productivity', 5),
+            'mood': checkin_level(data, 'mood'), 'energy': checkin_level(data, 'energy'),
+            'stress': checkin_level(data, 'stress'), 'productivity': data.get('productivity', 5),
             'notes': data.get('notes', ''), 'gratitude': data.get('gratitude', []),
             'goals_achieved': data.get('goals_achieved', False)
         }
         saved_checkin = save_checkin(user_id, 'evening', checkin_input)
-        history = get_recent_checkins(user_id, 7)
-        all_checkins = history['morning'] + history['afternoon'] + history['evening']
-        mood_analysis = analyze_mood_with_ai(all_checkins, checkin_input)
-        return jsonify({"success": True, "checkin": saved_checkin, "mood_analysis": mood_analysis})
+        return checkin_response(user_id, saved_checkin, checkin_input)
+    except InvalidCheckin as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    """Background job status and result; ?wait=N long-polls up to N seconds for completion"""
+    wait = min(request.args.get('wait', 0, type=float), JOB_WAIT_LIMIT)
+    job = jobs.get(job_id, wait)
+    if job is None or job.user_id != current_user_id():
+        return jsonify({"success": False, "error": "Unknown or expired job"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
 @app.route("/checkin/history")
 def get_checkin_history():
-    user_id = request.args.get('user_id', 'default_user')
+    user_id = current_user_id()
     days = request.args.get('days', 7, type=int)
     history = get_recent_checkins(user_id, days)
     return jsonify({
@@ -1018,13 +1302,13 @@ def get_checkin_history():
 
 @app.route("/checkin/status")
 def checkin_status():
-    user_id = request.args.get('user_id', 'default_user')
-    today = datetime.now().date()
-    history = get_recent_checkins(user_id, 1)
+    user_id = current_user_id()
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    history = checkin_store.range(user_id, today)
     
-    morning_done = any(datetime.fromisoformat(c['timestamp']).date() == today for c in history['morning'])
-    afternoon_done = any(datetime.fromisoformat(c['timestamp']).date() == today for c in history['afternoon'])
-    evening_done = any(datetime.fromisoformat(c['timestamp']).date() == today for c in history['evening'])
+    morning_done = bool(history['morning'])
+    afternoon_done = bool(history['afternoon'])
+    evening_done = bool(history['evening'])
     
     current_hour = datetime.now().hour
     if not morning_done and current_hour < 12:
@@ -1044,7 +1328,7 @@ def checkin_status():
 
 @app.route("/checkin/analytics")
 def checkin_analytics():
-    user_id = request.args.get('user_id', 'default_user')
+    user_id = current_user_id()
     days = request.args.get('days', 30, type=int)
     history = get_recent_checkins(user_id, days)
     all_checkins = history['morning'] + history['afternoon'] + history['evening']
@@ -1058,47 +1342,20 @@ def checkin_analytics():
             }
         })
     
-    moods = [c['data'].get('mood', 5) for c in all_checkins]
-    energies = [c['data'].get('energy', 5) for c in all_checkins]
-    stresses = [c['data'].get('stress', 5) for c in all_checkins]
-    
-    avg_mood = sum(moods) / len(moods)
-    avg_energy = sum(energies) / len(energies)
-    avg_stress = sum(stresses) / len(stresses)
-    
-    if len(moods) >= 2:
-        recent_avg = sum(moods[-3:]) / len(moods[-3:])
-        older_avg = sum(moods[:3]) / len(moods[:3])
-        trend = "improving" if recent_avg > older_avg + 0.5 else "declining" if recent_avg < older_avg - 0.5 else "stable"
-    else:
-        trend = "stable"
+    since = datetime.now() - timedelta(days=days)
+    points = request.args.get('points', MAX_CHART_POINTS, type=int)
+    analytics = analyze_checkins(history, since, days, points=max(2, points))
+    analytics["checkin_streak"] = len(all_checkins)
     
-    return jsonify({
-        "success": True,
-        "analytics": {
-            "average_mood": round(avg_mood, 1), "average_energy": round(avg_energy, 1),
-            "average_stress": round(avg_stress, 1), "trend": trend,
-            "total_checkins": len(all_checkins),
-            "checkin_streak": len(history['morning']) + len(history['afternoon']) + len(history['evening']),
-            "mood_history": moods, "energy_history": energies, "stress_history": stresses
-        }
-    })
+    return jsonify({"success": True, "analytics": analytics})
 
-def get_spotify_client():
+def get_spotify_client(user_id=DEFAULT_USER):
     try:
-        sp_oauth = SpotifyOAuth(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET,
-            redirect_uri=SPOTIFY_REDIRECT_URI,
-            scope="user-library-read user-top-read playlist-modify-public playlist-modify-private",
-            cache_path=".spotify_cache"
-        )
+        sp = integrations.spotify(user_id)
         
-        token_info = sp_oauth.get_cached_token()
-        
-        if token_info:
-            print("Using cached Spotify token")
-            return spotipy.Spotify(auth=token_info['access_token'])
+        if sp:
+            print("Using cached Spotify client")
+            return sp
         else:
             print("No Spotify token found - need authentication")
             return None
@@ -1174,13 +1431,7 @@ Return ONLY valid JSON in the following format:
 }}
 """
 
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
-            "model": "llama-3.3-70b-versatile",
             "messages": [
                 {"role": "system", "content": "You are an expert music therapist. Return ONLY valid JSON."},
                 {"role": "user", "content": prompt}
@@ -1191,15 +1442,11 @@ Return ONLY valid JSON in the following format:
         }
 
         print("🎵 Requesting AI music recommendations from Groq...")
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
+        ai_recommendations = llm.chat_json(
+            "music_recommendations", payload, timeout=30,
+            required=("recommended_tracks", "recommended_genres"),
+            confidence=filled_confidence("recommended_tracks", "recommended_genres")
         )
-        response.raise_for_status()
-        
-        ai_recommendations = json.loads(response.json()["choices"][0]["message"]["content"])
         print(f"AI recommendations received: {ai_recommendations.get('primary_mood_category')}")
         
         return ai_recommendations
@@ -1225,90 +1472,50 @@ Return ONLY valid JSON in the following format:
         }
 
 
-def search_spotify_tracks_with_ai(sp, ai_recommendations, limit=30):
+def spotify_track_info(item):
+    return {
+        "name": item['name'],
+        "artist": ", ".join([a['name'] for a in item['artists']]),
+        "uri": item['uri'],
+        "url": item['external_urls']['spotify'],
+        "popularity": item['popularity'],
+        "album": item['album']['name'],
+        "album_image": item['album']['images'][0]['url'] if item['album']['images'] else None
+    }
+
+def search_spotify_tracks_with_ai(sp, ai_recommendations, limit=30, deadline=None):
     """Search Spotify for tracks based on AI recommendations"""
-    tracks = []
-    
-    print("Searching for AI-recommended tracks...")
+    searches = []
     for track_rec in ai_recommendations.get('recommended_tracks', [])[:5]:
-        try:
-            query = f"{track_rec.get('track')} {track_rec.get('artist')}"
-            results = sp.search(q=query, type='track', limit=3)
-            
-            for item in results['tracks']['items']:
-                if len(tracks) >= limit:
-                    break
-                    
-                tracks.append({
-                    "name": item['name'],
-                    "artist": ", ".join([a['name'] for a in item['artists']]),
-                    "uri": item['uri'],
-                    "url": item['external_urls']['spotify'],
-                    "popularity": item['popularity'],
-                    "album": item['album']['name'],
-                    "album_image": item['album']['images'][0]['url'] if item['album']['images'] else None,
-                    "ai_reason": track_rec.get('reason'),
-                    "recommended_by": "AI - Specific Track"
-                })
-        except Exception as e:
-            print(f"Track search error: {e}")
-            continue
-    
-    print("Searching by recommended artists...")
+        searches.append(("Track", f"{track_rec.get('track')} {track_rec.get('artist')}", 3, track_rec))
     for artist in ai_recommendations.get('recommended_artists', [])[:5]:
-        try:
-            if len(tracks) >= limit:
-                break
-                
-            results = sp.search(q=f"artist:{artist}", type='track', limit=5)
-            
-            for item in results['tracks']['items']:
-                if len(tracks) >= limit:
-                    break
-                    
-                # Avoid duplicates
-                if not any(t['uri'] == item['uri'] for t in tracks):
-                    tracks.append({
-                        "name": item['name'],
-                        "artist": ", ".join([a['name'] for a in item['artists']]),
-                        "uri": item['uri'],
-                        "url": item['external_urls']['spotify'],
-                        "popularity": item['popularity'],
-                        "album": item['album']['name'],
-                        "album_image": item['album']['images'][0]['url'] if item['album']['images'] else None,
-                        "recommended_by": f"AI - Artist: {artist}"
-                    })
-        except Exception as e:
-            print(f"Artist search error: {e}")
-            continue
-    
-    print("Searching by genres...")
+        searches.append(("Artist", f"artist:{artist}", 5, artist))
     for genre in ai_recommendations.get('recommended_genres', [])[:5]:
+        searches.append(("Genre", f"genre:{genre}", 8, genre))
+
+    def search(entry):
+        kind, query, search_limit, _ = entry
         try:
+            return sp.search(q=query, type='track', limit=search_limit)['tracks']['items']
+        except Exception as e:
+            print(f"{kind} search error: {e}")
+            return []
+
+    print(f"Running {len(searches)} Spotify searches concurrently...")
+    results = fanout.map(search, searches, deadline or deadline_in(UPSTREAM_DEADLINE), default=[])
+
+    # Merge in the original priority order: specific tracks, then artists, then genres
+    tracks = []
+    for (kind, _, _, source), items in zip(searches, results):
+        for item in items:
             if len(tracks) >= limit:
                 break
-                
-            results = sp.search(q=f"genre:{genre}", type='track', limit=8)
-            
-            for item in results['tracks']['items']:
-                if len(tracks) >= limit:
-                    break
-                    
-                # Avoid duplicates
-                if not any(t['uri'] == item['uri'] for t in tracks):
-                    tracks.append({
-                        "name": item['name'],
-                        "artist": ", ".join([a['name'] for a in item['artists']]),
-                        "uri": item['uri'],
-                        "url": item['external_urls']['spotify'],
-                        "popularity": item['popularity'],
-                        "album": item['album']['name'],
-                        "album_image": item['album']['images'][0]['url'] if item['album']['images'] else None,
-                        "recommended_by": f"Genre: {genre}"
-                    })
-        except Exception as e:
-            print(f" Genre search error: {e}")
-            continue
+            if kind == "Track":
+                tracks.append(dict(spotify_track_info(item), ai_reason=source.get('reason'), recommended_by="AI - Specific Track"))
+            # Avoid duplicates
+            elif not any(t['uri'] == item['uri'] for t in tracks):
+                label = f"AI - Artist: {source}" if kind == "Artist" else f"Genre: {source}"
+                tracks.append(dict(spotify_track_info(item), recommended_by=label))
     
     # Sort: AI-specific tracks first, then by popularity
     ai_specific = [t for t in tracks if t.get('ai_reason')]
@@ -1321,7 +1528,7 @@ def search_spotify_tracks_with_ai(sp, ai_recommendations, limit=30):
     return final_tracks
 
 
-def get_curated_playlists(sp, stress_level):
+def get_curated_playlists(sp, stress_level, deadline=None):
     """Get curated Spotify playlists based on stress level"""
     query_map = {
         "critical": ["emergency calm", "deep relaxation", "anxiety relief"],
@@ -1337,21 +1544,23 @@ def get_curated_playlists(sp, stress_level):
     
     print(f"Searching for playlists with queries: {queries}")
     
-    for query in queries[:2]:
+    def search(query):
         try:
-            results = sp.search(q=query, type='playlist', limit=5)
-            for item in results['playlists']['items']:
-                playlists.append({
-                    "name": item['name'],
-                    "url": item['external_urls']['spotify'],
-                    "tracks": item['tracks']['total'],
-                    "description": item.get('description', ''),
-                    "image": item['images'][0]['url'] if item['images'] else None,
-                    "owner": item['owner']['display_name']
-                })
+            return sp.search(q=query, type='playlist', limit=5)['playlists']['items']
         except Exception as e:
             print(f"Playlist search error for '{query}': {e}")
-            continue
+            return []
+
+    for items in fanout.map(search, queries[:2], deadline or deadline_in(UPSTREAM_DEADLINE), default=[]):
+        for item in items:
+            playlists.append({
+                "name": item['name'],
+                "url": item['external_urls']['spotify'],
+                "tracks": item['tracks']['total'],
+                "description": item.get('description', ''),
+                "image": item['images'][0]['url'] if item['images'] else None,
+                "owner": item['owner']['display_name']
+            })
     
     print(f"Found {len(playlists)} curated playlists")
     return playlists[:10]
@@ -1360,17 +1569,21 @@ def get_curated_playlists(sp, stress_level):
 
 @app.route("/spotify-login")
 def spotify_login():
-    sp_oauth = SpotifyOAuth(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET,
-        redirect_uri=SPOTIFY_REDIRECT_URI,
-        scope=SPOTIFY_SCOPE,
-        show_dialog=True
-    )
-
+    """Start Spotify OAuth for the current user; ?redirect=true sends the browser straight to Spotify"""
+    user_id = current_user_id()
+    # Single-use state, held server-side and in this browser's session so the
+    # callback can only complete a login that the same session started
+    state = secrets.token_urlsafe(24)
+    spotify_login_states.put(state, user_id)
+    session['spotify_state'] = state
+    sp_oauth = integrations.spotify_oauth(user_id, show_dialog=True, state=state)
+    auth_url = sp_oauth.get_authorize_url()
+
+    if request.args.get('redirect', 'false').lower() == 'true':
+        return redirect(auth_url)
     return jsonify({
         "success": True,
-        "auth_url": sp_oauth.get_authorize_url()
+        "auth_url": auth_url
     })
 
 @app.route("/callback")
@@ -1380,17 +1593,16 @@ def spotify_callback():
         if not code:
             return jsonify({"error": "No auth code"}), 400
 
-        sp_oauth = SpotifyOAuth(
-            client_id=SPOTIFY_CLIENT_ID,
-            client_secret=SPOTIFY_CLIENT_SECRET,
-            redirect_uri=SPOTIFY_REDIRECT_URI,
-            scope=SPOTIFY_SCOPE,
-            cache_path=".spotify_cache"
-        )
+        state = request.args.get("state")
+        user_id = spotify_login_states.pop(state) if state else None
+        if user_id is None or session.pop('spotify_state', None) != state:
+            return jsonify({"error": "Invalid or expired login state"}), 400
+        sp_oauth = integrations.spotify_oauth(user_id)
 
         token_info = sp_oauth.get_access_token(code, as_dict=True)
+        integrations.forget(user_id, providers=('spotify',))
 
-        sp = spotipy.Spotify(auth=token_info["access_token"])
+        sp = integrations.spotify_client(auth=token_info["access_token"])
         user = sp.current_user()
 
         return jsonify({
@@ -1414,7 +1626,7 @@ def spotify_status():
     try:
         print("🎵 Checking Spotify authentication status...")
         
-        sp = get_spotify_client()
+        sp = get_spotify_client(current_user_id())
         
         if sp:
             user_info = sp.current_user()
@@ -1468,6 +1680,7 @@ def music_therapy():
         print("MUSIC THERAPY REQUEST")
         print("="*70)
         
+        user_id = current_user_id()
         user_mood = request.args.get('mood')
         user_preferences = request.args.get('preferences')
         
@@ -1477,7 +1690,7 @@ def music_therapy():
             print(f"User preferences: {user_preferences}")
         
         # Check Spotify authentication
-        sp = get_spotify_client()
+        sp = get_spotify_client(user_id)
         if not sp:
             print("Spotify not authenticated")
             return jsonify({
@@ -1489,9 +1702,8 @@ def music_therapy():
         
         # Get user's stress analysis
         print("Analyzing stress and wellness...")
-        calendar_events = fetch_calendar_events(7)
-        notion_tasks = fetch_notion_tasks()
-        stress_analysis = comprehensive_stress_intelligence(calendar_events, notion_tasks)
+        snapshot = get_wellness_snapshot(user_id, *snapshot_request_args(request.args))
+        stress_analysis = snapshot['stress_analysis']
         
         print(f"   Stress: {stress_analysis['stress_level']} ({stress_analysis['stress_score']}/10)")
         print(f"   Mood: {stress_analysis.get('mood_state')}")
@@ -1506,9 +1718,10 @@ def music_therapy():
         
         print(f"AI Goal: {ai_recommendations.get('therapeutic_goal')}")
         
-        tracks = search_spotify_tracks_with_ai(sp, ai_recommendations, limit=30)
+        search_deadline = deadline_in(UPSTREAM_DEADLINE)
+        tracks = search_spotify_tracks_with_ai(sp, ai_recommendations, limit=30, deadline=search_deadline)
         
-        playlists = get_curated_playlists(sp, stress_analysis['stress_level'])
+        playlists = get_curated_playlists(sp, stress_analysis['stress_level'], deadline=search_deadline)
         
         print(f"Compiled {len(tracks)} tracks and {len(playlists)} playlists")
         print("="*70 + "\n")
@@ -1560,20 +1773,17 @@ def create_playlist():
         user_mood = data.get("mood")
         user_preferences = data.get("preferences")
         playlist_name_custom = data.get("playlist_name")
+        user_id = current_user_id()
 
-        sp = get_spotify_client()
+        sp = get_spotify_client(user_id)
         if not sp:
             return jsonify({
                 "success": False,
                 "needs_auth": True
             }), 401
 
-        calendar_events = fetch_calendar_events(7)
-        notion_tasks = fetch_notion_tasks()
-        stress_analysis = comprehensive_stress_intelligence(
-            calendar_events,
-            notion_tasks
-        )
+        snapshot = get_wellness_snapshot(user_id, *snapshot_request_args(request.args))
+        stress_analysis = snapshot['stress_analysis']
 
         ai_recs = get_ai_music_recommendations(
             stress_analysis,
@@ -1631,52 +1841,54 @@ def create_playlist():
             "error": str(e)
         }), 500
 
-def search_youtube_videos(queries, max_results=4):
-    """Search YouTube for videos based on query list"""
-    all_videos = []
-    
-    for query in queries:
-        try:
-            print(f"Searching YouTube for: {query}")
-            
-            response = requests.get(
-                "https://www.googleapis.com/youtube/v3/search",
-                params={
-                    "part": "snippet",
-                    "q": query,
-                    "type": "video",
-                    "maxResults": max_results,
-                    "key": YOUTUBE_API_KEY,
-                    "videoDuration": "medium", # Filters for 4-20 minute videos
-                    "order": "relevance"
-                },
-                timeout=10
-            )
-            
-            response.raise_for_status()
+def search_youtube_query(query, max_results=4):
+    """Videos for a single YouTube search query"""
+    try:
+        print(f"Searching YouTube for: {query}")
+        
+        response = requests.get(
+            f"{YOUTUBE_API_URL}/search",
+            params={
+                "part": "snippet",
+                "q": query,
+                "type": "video",
+                "maxResults": max_results,
+                "key": YOUTUBE_API_KEY,
+                "videoDuration": "medium", # Filters for 4-20 minute videos
+                "order": "relevance"
+            },
+            timeout=10
+        )
+        
+        response.raise_for_status()
+        
+        return [{
+            "video_id": item["id"]["videoId"],
+            "title": item["snippet"]["title"],
+            "description": item["snippet"]["description"],
+            "thumbnail": item["snippet"]["thumbnails"]["high"]["url"],
+            "url": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
+            "channel": item["snippet"]["channelTitle"],
+            "published_at": item["snippet"]["publishedAt"],
+            "query_used": query
+        } for item in response.json().get("items", [])]
             
-            for item in response.json().get("items", []):
-                video_data = {
-                    "video_id": item["id"]["videoId"],
-                    "title": item["snippet"]["title"],
-                    "description": item["snippet"]["description"],
-                    "thumbnail": item["snippet"]["thumbnails"]["high"]["url"],
-                    "url": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
-                    "channel": item["snippet"]["channelTitle"],
-                    "published_at": item["snippet"]["publishedAt"],
-                    "query_used": query
-                }
-                all_videos.append(video_data)
-                
-        except requests.exceptions.HTTPError as e:
-            print(f"YouTube API error for query '{query}': {e}")
-            if e.response.status_code == 403:
-                print("YouTube API quota exceeded or invalid key")
-            continue
-        except Exception as e:
-            print(f" YouTube search error for '{query}': {e}")
-            continue
-    
+    except requests.exceptions.HTTPError as e:
+        print(f"YouTube API error for query '{query}': {e}")
+        if e.response.status_code == 403:
+            print("YouTube API quota exceeded or invalid key")
+        return []
+    except Exception as e:
+        print(f" YouTube search error for '{query}': {e}")
+        return []
+
+def search_youtube_videos(queries, max_results=4, deadline=None):
+    """Search YouTube for videos based on query list"""
+    results = fanout.map(
+        lambda query: search_youtube_query(query, max_results),
+        queries, deadline or deadline_in(UPSTREAM_DEADLINE), default=[]
+    )
+    all_videos = [video for videos in results for video in videos]
     print(f" Found {len(all_videos)} YouTube videos")
     return all_videos
 
@@ -1764,13 +1976,7 @@ Return ONLY valid JSON:
   "avoid_content": ["types of videos to avoid"]
 }}"""
 
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         payload = {
-            "model": "llama-3.3-70b-versatile",
             "messages": [
                 {"role": "system", "content": "You are an expert video therapy specialist. Return ONLY valid JSON."},
                 {"role": "user", "content": prompt}
@@ -1781,15 +1987,10 @@ Return ONLY valid JSON:
         }
 
         print("Requesting AI video recommendations from Groq...")
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
+        ai_recommendations = llm.chat_json(
+            "video_recommendations", payload, timeout=30, required=("recommended_searches",),
+            confidence=filled_confidence("recommended_searches")
         )
-        response.raise_for_status()
-        
-        ai_recommendations = json.loads(response.json()["choices"][0]["message"]["content"])
         print(f" AI video recommendations received: {ai_recommendations.get('primary_video_category')}")
         
         return ai_recommendations
@@ -1830,6 +2031,7 @@ def video_therapy():
         print("\n" + "="*70)
         print("VIDEO THERAPY REQUEST")
         
+        user_id = current_user_id()
         user_mood = request.args.get('mood')
         use_ai = request.args.get('use_ai', 'true').lower() == 'true'
         
@@ -1837,9 +2039,8 @@ def video_therapy():
             print(f" User mood: {user_mood}")
         
         print(" Analyzing stress and wellness...")
-        calendar_events = fetch_calendar_events(7)
-        notion_tasks = fetch_notion_tasks()
-        stress_analysis = comprehensive_stress_intelligence(calendar_events, notion_tasks)
+        snapshot = get_wellness_snapshot(user_id, *snapshot_request_args(request.args))
+        stress_analysis = snapshot['stress_analysis']
         
         print(f"   Stress: {stress_analysis['stress_level']} ({stress_analysis['stress_score']}/10)")
         print(f"   Mood: {stress_analysis.get('mood_state')}")
@@ -0,0 +1,77 @@
+from flask import Blueprint, current_app, g, jsonify, request, session
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash
+from integrations import DEFAULT_USER
+from models import db, User
+
+auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
+
+# Lifetime of the bearer tokens handed out by /auth/login
+TOKEN_MAX_AGE = 30 * 86400
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt="zenschedule-api-token")
+
+
+def issue_token(user):
+    return _serializer().dumps({"uid": user.id})
+
+
+def resolve_user():
+    """before_request hook: set g.user_id from a bearer token or the login session
+
+    Requests carrying neither act as DEFAULT_USER, whose credentials come from
+    the process configuration; a users row is only reachable once its owner
+    has authenticated.
+    """
+    g.user_id = DEFAULT_USER
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        try:
+            claims = _serializer().loads(
+                header[len("Bearer "):].strip(),
+                max_age=current_app.config.get("AUTH_TOKEN_MAX_AGE", TOKEN_MAX_AGE)
+            )
+        except BadSignature:
+            return jsonify({"success": False, "error": "Invalid or expired token"}), 401
+        user_id = claims.get("uid")
+    else:
+        user_id = session.get("user_id")
+
+    if user_id is None:
+        return None
+    if db.session.get(User, int(user_id)) is None:
+        session.pop("user_id", None)
+        return jsonify({"success": False, "error": "Unknown user"}), 401
+    g.user_id = str(user_id)
+    return None
+
+
+def current_user_id():
+    """Authenticated user for this request, or DEFAULT_USER"""
+    return g.get("user_id", DEFAULT_USER)
+
+
+@auth_bp.route("/login", methods=["POST"])
+def login():
+    """Check email and password; starts a session and returns a bearer token"""
+    data = request.json or {}
+    user = User.query.filter_by(email=data.get("email")).first() if data.get("email") else None
+    try:
+        valid = user is not None and check_password_hash(user.password, data.get("password") or "")
+    except ValueError:
+        valid = False
+    if not valid:
+        return jsonify({"success": False, "error": "Invalid email or password"}), 401
+
+    session.clear()
+    session["user_id"] = user.id
+    session.permanent = True
+    return jsonify({"success": True, "token": issue_token(user), "user": user.to_dict()})
+
+
+@auth_bp.route("/logout", methods=["POST"])
+def logout():
+    session.clear()
+    return jsonify({"success": True})
@@ -0,0 +1,202 @@
+"""End-to-end latency benchmark for the backend routes.
+
+By default this starts every fake upstream from fake_upstreams.py, launches
+app.py against them in a scratch directory and drives the routes, e.g.
+
+    python bench.py --requests 200 --concurrency 8
+    python bench.py --routes analyze,music-therapy --groq-latency 0.8 --refresh
+    python bench.py --routes schedule-breaks --auto-insert
+
+Use --target to benchmark an already running backend instead.
+"""
+import argparse
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import requests
+from fake_upstreams import FAKES, fake_env, write_fake_spotify_cache, write_fake_token
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKIN_PERIODS = ('morning', 'afternoon', 'evening')
+ROUTES = {
+    'analyze': ('GET', '/analyze'),
+    'schedule-breaks': ('GET', '/schedule-breaks'),
+    'music-therapy': ('GET', '/music-therapy'),
+    'video-therapy': ('GET', '/video-therapy'),
+    'checkin': ('POST', '/checkin/{period}')
+}
+SERVE_APP = (
+    "import sys; sys.path.insert(0, {backend!r})\n"
+    "from app import app\n"
+    "app.run(host='127.0.0.1', port={port}, threaded=True)\n"
+)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[rank]
+
+
+def start_fakes(args):
+    fakes = {}
+    for name, fake_class in FAKES.items():
+        fakes[name] = fake_class(
+            latency=getattr(args, f"{name}_latency"), error_rate=args.error_rate, size=args.size
+        ).start()
+    now = datetime.now(timezone.utc)
+    for i in range(args.size):
+        fakes['calendar'].add_event(f"Meeting {i}", now + timedelta(hours=3 * i + 1), minutes=45, notify=False)
+    return fakes
+
+
+def launch_backend(fakes, port, workdir):
+    """Run app.py against the fakes in workdir and wait until it answers"""
+    write_fake_token(os.path.join(workdir, 'token_calendar.json'))
+    write_fake_spotify_cache(os.path.join(workdir, '.spotify_cache'))
+
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               GROQ_API_KEY='fake', NOTION_API_KEY='fake', NOTION_DATABASE_ID='fake-db',
+               YOUTUBE_API_KEY='fake', SPOTIFY_CLIENT_ID='fake', SPOTIFY_CLIENT_SECRET='fake',
+               GROQ_RPM='100000', GROQ_TPM='100000000')
+    for name, fake in fakes.items():
+        env.update(fake_env(name, fake.url))
+
+    log = open(os.path.join(workdir, 'backend.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVE_APP.format(backend=BACKEND_DIR, port=port)],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"backend exited early; see {log.name}")
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"backend did not start; see {log.name}")
+
+
+def run_benchmark(base_url, routes, total, concurrency, refresh, auto_insert=False):
+    local = threading.local()
+    counter = iter(range(total))
+    lock = threading.Lock()
+    results = {route: {"latencies": [], "errors": 0} for route in routes}
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        route = routes[i % len(routes)]
+        method, path = ROUTES[route]
+        started = time.perf_counter()
+        try:
+            if method == 'POST':
+                period = CHECKIN_PERIODS[i % len(CHECKIN_PERIODS)]
+                response = session.post(base_url + path.format(period=period),
+                                        json={"mood": 6, "energy": 5, "stress": 4}, timeout=60)
+            else:
+                params = {"refresh": "true"} if refresh else {}
+                if auto_insert and route == 'schedule-breaks':
+                    params["auto_insert"] = "true"
+                response = session.get(base_url + path, params=params, timeout=60)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            results[route]["latencies"].append(elapsed)
+            results[route]["errors"] += 0 if ok else 1
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            one(i)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return results, time.perf_counter() - started
+
+
+def report(results, wall_time):
+    print(f"{'route':<18}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>9}")
+    everything = []
+    total_errors = 0
+    for route, result in results.items():
+        latencies = sorted(result["latencies"])
+        everything.extend(latencies)
+        total_errors += result["errors"]
+        print(f"{route:<18}{len(latencies):>7}{result['errors']:>8}"
+              f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}"
+              f"{percentile(latencies, 99) * 1000:>10.1f}{(latencies[-1] if latencies else 0) * 1000:>10.1f}"
+              f"{len(latencies) / wall_time:>9.1f}")
+    everything.sort()
+    print(f"{'all':<18}{len(everything):>7}{total_errors:>8}"
+          f"{percentile(everything, 50) * 1000:>10.1f}{percentile(everything, 95) * 1000:>10.1f}"
+          f"{percentile(everything, 99) * 1000:>10.1f}{(everything[-1] if everything else 0) * 1000:>10.1f}"
+          f"{len(everything) / wall_time:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', default='analyze,schedule-breaks,music-therapy,checkin',
+                        help=f"comma-separated subset of {', '.join(ROUTES)}")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--refresh', action='store_true', help="bypass the wellness snapshot on every GET")
+    parser.add_argument('--auto-insert', action='store_true',
+                        help="have schedule-breaks insert its breaks through the calendar batch endpoint")
+    parser.add_argument('--target', help="base URL of a running backend; skips starting fakes")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--size', type=int, default=10, help="items per fake upstream response")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    for name in FAKES:
+        parser.add_argument(f'--{name}-latency', type=float, default=0.05 if name != 'groq' else 0.3)
+    args = parser.parse_args()
+
+    routes = [route.strip() for route in args.routes.split(',') if route.strip()]
+    unknown = [route for route in routes if route not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    process = None
+    fakes = {}
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            workdir = tempfile.mkdtemp(prefix='zenschedule-bench-')
+            fakes = start_fakes(args)
+            process, base_url = launch_backend(fakes, args.port, workdir)
+            print(f"Backend running in {workdir}")
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, routes: {', '.join(routes)}")
+        results, wall_time = run_benchmark(
+            base_url, routes, args.requests, args.concurrency, args.refresh, args.auto_insert
+        )
+        report(results, wall_time)
+        print(f"Wall time {wall_time:.2f}s")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        for fake in fakes.values():
+            fake.stop()
@@ -1,10 +1,71 @@
+import threading
+from bisect import bisect_left, bisect_right
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 
 breaks_bp = Blueprint("breaks", __name__, url_prefix="/breaks")
 
+class BreakHistory:
+    """Completed breaks: raw records for the last `hot_days`, daily rollups before that
+
+    Records are appended with their epoch time so window queries are a binary
+    search; compact() folds records that leave the hot window into one rollup
+    per day.
+    """
+
+    def __init__(self, hot_days=30):
+        self.hot_days = hot_days
+        self.lock = threading.Lock()
+        self.times = []
+        self.records = []
+        self.rollup_times = []
+        self.rollups = []
+
+    def append(self, ts, record):
+        with self.lock:
+            if not self.times or ts >= self.times[-1]:
+                self.times.append(ts)
+                self.records.append(record)
+            else:
+                i = bisect_right(self.times, ts)
+                self.times.insert(i, ts)
+                self.records.insert(i, record)
+
+    def since(self, cutoff):
+        """(records after cutoff, rollups of days from cutoff's day onwards)"""
+        day_start = datetime.fromtimestamp(cutoff).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        with self.lock:
+            records = self.records[bisect_right(self.times, cutoff):]
+            rollups = [dict(r, by_type=dict(r["by_type"])) for r in self.rollups[bisect_left(self.rollup_times, day_start):]]
+        return records, rollups
+
+    def compact(self, now):
+        """Fold records older than the hot window into daily rollups; returns how many"""
+        cutoff = now - self.hot_days * 86400
+        with self.lock:
+            cut = bisect_right(self.times, cutoff)
+            old_times, old_records = self.times[:cut], self.records[:cut]
+            del self.times[:cut]
+            del self.records[:cut]
+            # Earlier compactions cut at earlier cutoffs, so these days are never
+            # older than the last rollup and can be appended in order
+            for ts, record in zip(old_times, old_records):
+                day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+                if not self.rollup_times or self.rollup_times[-1] != day.timestamp():
+                    self.rollup_times.append(day.timestamp())
+                    self.rollups.append({
+                        "date": day.date().isoformat(), "total_breaks": 0, "completed_breaks": 0,
+                        "minutes": 0, "by_type": {}
+                    })
+                rollup = self.rollups[-1]
+                rollup["total_breaks"] += 1
+                rollup["completed_breaks"] += 1 if record["completed"] else 0
+                rollup["minutes"] += record["duration"] if record["completed"] else 0
+                rollup["by_type"][record["type"]] = rollup["by_type"].get(record["type"], 0) + 1
+        return cut
+
 ACTIVE_BREAK = None
-BREAK_HISTORY = []
+BREAK_HISTORY = BreakHistory()
 
 BREAK_CONTENT = {
     "breathing": {
@@ -147,16 +208,17 @@ def complete_break():
     if break_id and ACTIVE_BREAK["id"] != break_id:
         return jsonify({"error": "Break ID mismatch"}), 400
 
+    now = datetime.now()
     record = {
         "break_id": ACTIVE_BREAK["id"],
         "type": ACTIVE_BREAK["type"],
         "duration": ACTIVE_BREAK["duration"],
         "completed": completed,
         "feedback": feedback,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now.isoformat()
     }
 
-    BREAK_HISTORY.append(record)
+    BREAK_HISTORY.append(now.timestamp(), record)
     
     print(f"Break completed: {ACTIVE_BREAK['type']}")
     
@@ -197,19 +259,17 @@ def get_break_history():
     
     cutoff = datetime.now() - timedelta(days=days)
     
-    recent_history = [
-        record for record in BREAK_HISTORY
-        if datetime.fromisoformat(record["timestamp"]) > cutoff
-    ]
+    recent_history, rollups = BREAK_HISTORY.since(cutoff.timestamp())
 
     # Calculate stats
-    total_breaks = len(recent_history)
-    completed_breaks = sum(1 for r in recent_history if r["completed"])
+    total_breaks = len(recent_history) + sum(r["total_breaks"] for r in rollups)
+    completed_breaks = sum(1 for r in recent_history if r["completed"]) + sum(r["completed_breaks"] for r in rollups)
     completion_rate = (completed_breaks / total_breaks * 100) if total_breaks > 0 else 0
 
     return jsonify({
         "success": True,
         "history": recent_history,
+        "daily_rollups": rollups,
         "stats": {
             "total_breaks": total_breaks,
             "completed_breaks": completed_breaks,
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            evicted = self._trim()
+        self._evicted(evicted)
+
+    def values(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def pop(self, key, default=None):
+        with self.lock:
+            value = self.entries.pop(key, default)
+        return value
+
+    def _trim(self):
+        evicted = []
+        while len(self.entries) > self.maxsize:
+            evicted.append(self.entries.popitem(last=False))
+        return evicted
+
+    def _evicted(self, evicted):
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries also expire ttl seconds after they were stored"""
+
+    def __init__(self, maxsize, ttl, on_evict=None):
+        super().__init__(maxsize, on_evict)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.pop(key)
+            return default
+        return value
+
+    def put(self, key, value, ttl=None):
+        super().put(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
+
+    def pop(self, key, default=None):
+        entry = super().pop(key)
+        return default if entry is None else entry[1]
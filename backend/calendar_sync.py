@@ -0,0 +1,218 @@
+import secrets
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from googleapiclient.errors import HttpError
+from freebusy import FreeBusy
+
+# Events are mirrored for this many days ahead; a full resync runs once
+# the requested window would reach past the mirrored horizon.
+SYNC_HORIZON_DAYS = 30
+SYNC_LOOKBACK_DAYS = 1
+
+
+def to_epoch(value):
+    """Convert a Calendar dateTime or all-day date string to epoch seconds"""
+    if len(value) == 10:
+        return datetime.fromisoformat(value).timestamp()
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class Event:
+    """Calendar event parsed once per sync: epoch times, duration and lowercased text"""
+    __slots__ = (
+        'id', 'summary', 'description', 'start', 'end', 'location', 'attendees',
+        'html_link', 'transparency', 'all_day', 'start_ts', 'end_ts', 'duration_hours', 'text'
+    )
+
+    def __init__(self, item):
+        start = item.get('start', {})
+        end = item.get('end', {})
+        self.id = item.get('id')
+        self.summary = item.get('summary', 'No Title')
+        self.description = item.get('description', '')
+        self.start = start.get('dateTime', start.get('date'))
+        self.end = end.get('dateTime', end.get('date'))
+        self.location = item.get('location', '')
+        self.attendees = len(item.get('attendees', []))
+        self.html_link = item.get('htmlLink', '')
+        self.transparency = item.get('transparency', 'opaque')
+        self.all_day = 'dateTime' not in start
+        self.start_ts = to_epoch(self.start)
+        self.end_ts = to_epoch(self.end)
+        self.duration_hours = (self.end_ts - self.start_ts) / 3600
+        self.text = f"{self.summary}\n{self.description}".lower()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "summary": self.summary,
+            "description": self.description,
+            "start": self.start,
+            "end": self.end,
+            "location": self.location,
+            "attendees": self.attendees,
+            "htmlLink": self.html_link,
+            "transparency": self.transparency
+        }
+
+
+def iter_event_pages(service, calendar_id='primary', page_size=250, **params):
+    """Yield events.list result pages, fetching the next page while the caller works on the current one"""
+    def fetch(page_token):
+        return service.events().list(
+            calendarId=calendar_id, singleEvents=True,
+            maxResults=page_size, pageToken=page_token, **params
+        ).execute()
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetcher.submit(fetch, None)
+        while pending:
+            page = pending.result()
+            page_token = page.get('nextPageToken')
+            pending = prefetcher.submit(fetch, page_token) if page_token else None
+            yield page
+
+
+class CalendarEventStore:
+    """Local mirror of one calendar, kept current with events.list syncToken deltas"""
+
+    def __init__(self, calendar_id='primary'):
+        self.calendar_id = calendar_id
+        self.lock = threading.Lock()
+        self.version = 0
+        self.cached_freebusy = None
+        self.channel = None
+        self.dirty = True
+        self.reset()
+
+    def reset(self):
+        self.events = {}
+        self.sync_token = None
+        self.horizon = None
+        self.last_sync = None
+
+    def sync(self, service, days=7):
+        """Pull changes since the last sync, falling back to a full sync when needed"""
+        with self.lock:
+            now = datetime.utcnow()
+            needs_full = (
+                not self.sync_token
+                or self.horizon is None
+                or now + timedelta(days=days) > self.horizon
+            )
+            if not needs_full and not self.dirty and self.watching():
+                return 0
+            self.dirty = False
+            try:
+                return self._sync(service, days, now, needs_full)
+            except Exception:
+                self.dirty = True
+                raise
+
+    def _sync(self, service, days, now, needs_full):
+        if not needs_full:
+            try:
+                changed = self._list(service, syncToken=self.sync_token)
+                print(f" Calendar delta sync: {changed} changed events")
+                return changed
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                print(" Sync token expired, running full calendar sync")
+
+        self.reset()
+        horizon = now + timedelta(days=max(days, SYNC_HORIZON_DAYS))
+        changed = self._list(
+            service,
+            timeMin=(now - timedelta(days=SYNC_LOOKBACK_DAYS)).isoformat() + 'Z',
+            timeMax=horizon.isoformat() + 'Z'
+        )
+        self.horizon = horizon
+        print(f" Calendar full sync: {changed} events")
+        return changed
+
+    def watching(self):
+        return bool(self.channel) and self.channel['expiration'] > time.time()
+
+    def watch(self, service, address, ttl_seconds=7 * 24 * 3600):
+        """Register an events.watch channel that posts change notifications to address"""
+        body = {
+            'id': str(uuid.uuid4()),
+            'type': 'web_hook',
+            'address': address,
+            'token': secrets.token_urlsafe(24),
+            'params': {'ttl': str(ttl_seconds)}
+        }
+        result = service.events().watch(calendarId=self.calendar_id, body=body).execute()
+        expiration = result.get('expiration')
+        with self.lock:
+            self.channel = {
+                'id': body['id'],
+                'token': body['token'],
+                'resource_id': result.get('resourceId'),
+                'expiration': int(expiration) / 1000 if expiration else time.time() + ttl_seconds
+            }
+            self.dirty = True
+        print(f" Calendar watch channel registered: {body['id']}")
+        return self.channel
+
+    def stop_watch(self, service):
+        with self.lock:
+            channel, self.channel = self.channel, None
+            self.dirty = True
+        if channel:
+            service.channels().stop(body={'id': channel['id'], 'resourceId': channel['resource_id']}).execute()
+            print(f" Calendar watch channel stopped: {channel['id']}")
+        return channel
+
+    def handle_notification(self, channel_id, token, resource_state):
+        """Mark the store dirty for a push from our channel; False when the push is not ours"""
+        with self.lock:
+            if not self.channel or self.channel['id'] != channel_id or self.channel['token'] != token:
+                return False
+            if resource_state != 'sync':
+                self.dirty = True
+            return True
+
+    def _list(self, service, **params):
+        changed = 0
+        result = {}
+        for result in iter_event_pages(service, self.calendar_id, **params):
+            for item in result.get('items', []):
+                self._apply(item)
+                changed += 1
+
+        self.sync_token = result.get('nextSyncToken')
+        self.last_sync = datetime.utcnow()
+        if changed or 'syncToken' not in params:
+            self.version += 1
+        return changed
+
+    def _apply(self, item):
+        event_id = item.get('id')
+        if item.get('status') == 'cancelled':
+            self.events.pop(event_id, None)
+            return
+
+        try:
+            self.events[event_id] = Event(item)
+        except (TypeError, ValueError):
+            print(f" Skipping event with missing or unparseable time: {event_id}")
+
+    def events_between(self, time_min, time_max):
+        """Events overlapping [time_min, time_max), ordered by start time"""
+        lo, hi = time_min.timestamp(), time_max.timestamp()
+        with self.lock:
+            window = [event for event in self.events.values() if event.end_ts > lo and event.start_ts < hi]
+        window.sort(key=lambda event: event.start_ts)
+        return window
+
+    def freebusy(self):
+        """Busy intervals for the mirrored calendar, rebuilt only when the store changes"""
+        with self.lock:
+            if self.cached_freebusy is None or self.cached_freebusy[0] != self.version:
+                self.cached_freebusy = (self.version, FreeBusy.from_events(self.events.values()))
+            return self.cached_freebusy[1]
@@ -0,0 +1,129 @@
+import numpy as np
+from checkin_store import CHECKIN_PERIODS
+
+METRICS = ('mood', 'energy', 'stress')
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+# Points per series handed to the history charts
+MAX_CHART_POINTS = 30
+MOVING_AVERAGE_DAYS = 7
+# Change in daily average mood across the window that counts as a trend
+TREND_THRESHOLD = 0.5
+
+
+def _rounded(values, digits=1):
+    """Array -> JSON-safe list, with empty buckets (NaN) as None"""
+    return [None if np.isnan(v) else round(float(v), digits) + 0.0 for v in values]
+
+
+def _ratio(sums, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def checkin_arrays(history):
+    """(timestamps, period index, values) for a {period: [entry, ...]} history
+
+    values is an (n, 3) float matrix of mood, energy and stress with NaN for
+    missing answers; timestamps are parsed in one vectorised call.
+    """
+    entries, periods = [], []
+    for index, period in enumerate(CHECKIN_PERIODS):
+        entries.extend(history.get(period, []))
+        periods.extend([index] * len(history.get(period, [])))
+    timestamps = np.array([entry['timestamp'] for entry in entries], dtype='datetime64[s]')
+    values = np.array(
+        [[entry['data'].get(metric, 5) for metric in METRICS] for entry in entries], dtype=float
+    ).reshape(len(entries), len(METRICS))
+    return timestamps, np.array(periods, dtype=int), values
+
+
+def bucket(index, values, size):
+    """(sums, counts) of each metric per bucket, shape (size, 3); NaNs are not counted"""
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = np.stack([np.bincount(index, weights=filled[:, m], minlength=size) for m in range(values.shape[1])], axis=1)
+    counts = np.stack([np.bincount(index, weights=present[:, m], minlength=size) for m in range(values.shape[1])], axis=1)
+    return sums, counts
+
+
+def moving_average(sums, counts, window=MOVING_AVERAGE_DAYS):
+    """Trailing `window`-day average per day, weighted by check-ins rather than days"""
+    kernel = np.ones(window)
+    days = len(sums)
+    rolled_sums = np.stack([np.convolve(sums[:, m], kernel)[:days] for m in range(sums.shape[1])], axis=1)
+    rolled_counts = np.stack([np.convolve(counts[:, m], kernel)[:days] for m in range(counts.shape[1])], axis=1)
+    return _ratio(rolled_sums, rolled_counts)
+
+
+def slopes(daily):
+    """Least-squares change per day of each metric's daily average, over days with data"""
+    result = []
+    for m in range(daily.shape[1]):
+        days = np.flatnonzero(~np.isnan(daily[:, m]))
+        if len(days) < 2:
+            result.append(0.0)
+            continue
+        result.append(float(np.polyfit(days, daily[days, m], 1)[0]))
+    return np.array(result)
+
+
+def downsample(sums, counts, points):
+    """Merge consecutive days into at most `points` buckets; returns (start indices, averages)"""
+    days = len(sums)
+    if days <= points:
+        return np.arange(days), _ratio(sums, counts)
+    starts = np.linspace(0, days, points, endpoint=False).astype(int)
+    return starts, _ratio(np.add.reduceat(sums, starts, axis=0), np.add.reduceat(counts, starts, axis=0))
+
+
+def analyze_checkins(history, since, days, points=MAX_CHART_POINTS, window=MOVING_AVERAGE_DAYS):
+    """Averages, trend, variance, period/weekday patterns and chart series for check-ins since `since`"""
+    timestamps, periods, values = checkin_arrays(history)
+    start = np.datetime64(since.date(), 'D')
+    days = days + 1
+    day_index = np.clip((timestamps.astype('datetime64[D]') - start).astype(int), 0, days - 1)
+
+    overall = np.zeros(len(values), dtype=int)
+    totals, answered = bucket(overall, values, 1)
+    averages = _ratio(totals[0], answered[0])
+    variance = _ratio(bucket(overall, (values - averages) ** 2, 1)[0][0], answered[0])
+    sums, counts = bucket(day_index, values, days)
+    daily = _ratio(sums, counts)
+    moving = moving_average(sums, counts, window)
+    slope = slopes(daily)
+
+    active = np.flatnonzero(counts.sum(axis=1) > 0)
+    mood_change = slope[0] * (active[-1] - active[0]) if len(active) >= 2 else 0.0
+    trend = "improving" if mood_change > TREND_THRESHOLD else "declining" if mood_change < -TREND_THRESHOLD else "stable"
+
+    period_means = _ratio(*bucket(periods, values, len(CHECKIN_PERIODS)))
+    period_counts = np.bincount(periods, minlength=len(CHECKIN_PERIODS))
+    # 1970-01-01 was a Thursday, so day number + 3 is 0 on Mondays
+    weekdays = (timestamps.astype('datetime64[D]').astype(int) + 3) % 7
+    weekday_means = _ratio(*bucket(weekdays, values, 7))
+    weekday_counts = np.bincount(weekdays, minlength=7)
+
+    starts, series = downsample(sums, counts, points)
+    _, moving_series = downsample(np.nan_to_num(moving), (~np.isnan(moving)).astype(float), points)
+
+    return {
+        **{f"average_{metric}": value for metric, value in zip(METRICS, _rounded(averages))},
+        "trend": trend,
+        "slopes": dict(zip(METRICS, _rounded(slope, 3))),
+        "variance": dict(zip(METRICS, _rounded(variance, 2))),
+        "total_checkins": len(values),
+        "active_days": len(active),
+        "period_patterns": {
+            period: dict(zip(METRICS, _rounded(period_means[i])), count=int(period_counts[i]))
+            for i, period in enumerate(CHECKIN_PERIODS)
+        },
+        "weekday_patterns": {
+            name: dict(zip(METRICS, _rounded(weekday_means[i])), count=int(weekday_counts[i]))
+            for i, name in enumerate(WEEKDAYS)
+        },
+        "series": {
+            "dates": [str(start + int(i)) for i in starts],
+            **{metric: _rounded(series[:, m]) for m, metric in enumerate(METRICS)},
+            **{f"{metric}_moving_average": _rounded(moving_series[:, m]) for m, metric in enumerate(METRICS)}
+        }
+    }
@@ -0,0 +1,451 @@
+import atexit
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+from cache import LRUCache
+from models import db, Checkin
+
+CHECKIN_PERIODS = ('morning', 'afternoon', 'evening')
+# Days of check-ins held in memory per user; older windows are read from the table
+CHECKIN_HOT_DAYS = 30
+# Trailing window covered by the running stress/energy totals
+CHECKIN_ROLLING_DAYS = 7
+# How far back each read re-checks the table for rows written by other processes
+CHECKIN_SYNC_LAG = 300
+# Minimum seconds between the table re-checks made by range() and rolling_totals()
+CHECKIN_CATCH_UP_INTERVAL = 60
+# Seconds before a user's timelines are reloaded from the table in full
+CHECKIN_TIMELINE_TTL = 900
+# Rows the table rejected, kept for inspection through stats() instead of being retried forever
+CHECKIN_DEAD_LETTERS = 1000
+
+
+def pending_entry(row):
+    """Response shape of a buffered row, matching Checkin.to_dict()"""
+    return {
+        'id': row['uid'],
+        'timestamp': row['timestamp'].isoformat(),
+        'type': row['checkin_type'],
+        'data': row['data'],
+        'signals': {k: row[k] for k in ('stress', 'energy', 'mood', 'focus')}
+    }
+
+
+class CheckinTimeline:
+    """One user's check-ins for one period, sorted by epoch timestamp"""
+    __slots__ = ("times", "entries")
+
+    def __init__(self):
+        self.times = []
+        self.entries = []
+
+    def __len__(self):
+        return len(self.times)
+
+    def add(self, ts, entry):
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.entries.append(entry)
+        else:
+            i = bisect_right(self.times, ts)
+            self.times.insert(i, ts)
+            self.entries.insert(i, entry)
+
+    def trim(self, before):
+        """Drop entries older than `before`; returns how many were dropped"""
+        cut = bisect_left(self.times, before)
+        del self.times[:cut]
+        del self.entries[:cut]
+        return cut
+
+    def window(self, since, until=None):
+        """Entries with since <= ts < until, found by binary search"""
+        lo = bisect_left(self.times, since)
+        hi = len(self.times) if until is None else bisect_left(self.times, until)
+        return self.entries[lo:hi]
+
+
+class RollingCheckinStats:
+    """Running stress and energy sums over a trailing window, overall and per period
+
+    Samples are kept in time order so expiry only ever pops from the left;
+    every update and read is amortised O(1).
+    """
+    __slots__ = ("window", "times", "samples", "count", "stress_sum", "energy_sum", "period_totals")
+
+    def __init__(self, window):
+        self.window = window
+        self.times = deque()
+        self.samples = deque()
+        self.count = 0
+        self.stress_sum = 0
+        self.energy_sum = 0
+        self.period_totals = {period: [0, 0, 0] for period in CHECKIN_PERIODS}
+
+    def _apply(self, sample, sign):
+        _, period, stress, energy = sample
+        self.count += sign
+        self.stress_sum += sign * stress
+        self.energy_sum += sign * energy
+        totals = self.period_totals[period]
+        totals[0] += sign
+        totals[1] += sign * stress
+        totals[2] += sign * energy
+
+    def add(self, ts, period, stress, energy):
+        sample = (ts, period, 5 if stress is None else stress, 5 if energy is None else energy)
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.samples.append(sample)
+        else:
+            i = bisect_right(self.times, ts)
+            self.times.insert(i, ts)
+            self.samples.insert(i, sample)
+        self._apply(sample, 1)
+
+    def expire(self, now):
+        cutoff = now - self.window
+        while self.times and self.times[0] <= cutoff:
+            self.times.popleft()
+            self._apply(self.samples.popleft(), -1)
+
+    def totals(self, now):
+        self.expire(now)
+        return {
+            "count": self.count,
+            "stress_sum": self.stress_sum,
+            "energy_sum": self.energy_sum,
+            "periods": {
+                period: {"count": count, "stress_sum": stress, "energy_sum": energy}
+                for period, (count, stress, energy) in self.period_totals.items()
+            }
+        }
+
+
+class UserTimelines:
+    __slots__ = ("horizon", "periods", "rolling", "loaded_at", "synced")
+
+    def __init__(self, horizon, rolling_window, loaded_at):
+        self.horizon = horizon
+        self.loaded_at = loaded_at
+        self.synced = loaded_at
+        self.periods = {period: CheckinTimeline() for period in CHECKIN_PERIODS}
+        self.rolling = RollingCheckinStats(rolling_window)
+
+    def add(self, ts, period, entry):
+        self.periods[period].add(ts, entry)
+        self.rolling.add(ts, period, entry['signals']['stress'], entry['signals']['energy'])
+
+    def start_rolling(self, now):
+        """Seed the running totals from the timelines once they are loaded"""
+        since = now - self.rolling.window
+        samples = []
+        for period, timeline in self.periods.items():
+            start = bisect_right(timeline.times, since)
+            for ts, entry in zip(timeline.times[start:], timeline.entries[start:]):
+                samples.append((ts, period, entry['signals']['stress'], entry['signals']['energy']))
+        for sample in sorted(samples, key=lambda item: item[0]):
+            self.rolling.add(*sample)
+
+
+class CheckinStore:
+    """Check-ins persisted to the checkins table through a write-behind buffer
+
+    add() only appends to an in-memory buffer; a background thread commits the
+    buffer in batches every `flush_interval` seconds or as soon as it holds
+    `batch_size` rows. Reads merge rows that are not committed yet, so a
+    check-in is visible as soon as add() returns. Each user's last `hot_days`
+    of check-ins are also kept in memory as epoch-sorted timelines.
+
+    Other worker processes write to the same table, so reads pull the user's
+    rows from the last `sync_lag` seconds through the index, at most once every
+    `catch_up_interval` seconds; other reads are answered from memory.
+    Timelines are reloaded in full once they are `timeline_ttl` seconds old.
+
+    The checkins table must exist before the store is used; the app creates
+    it with db.create_all() when it is set up.
+    """
+
+    def __init__(self, app, batch_size=50, flush_interval=1.0, hot_days=CHECKIN_HOT_DAYS, max_users=1024,
+                 rolling_days=CHECKIN_ROLLING_DAYS, sync_lag=CHECKIN_SYNC_LAG, timeline_ttl=CHECKIN_TIMELINE_TTL,
+                 catch_up_interval=CHECKIN_CATCH_UP_INTERVAL):
+        self.app = app
+        self.sync_lag = sync_lag
+        self.catch_up_interval = catch_up_interval
+        self.timeline_ttl = timeline_ttl
+        self.hot_days = max(hot_days, rolling_days)
+        self.rolling_window = rolling_days * 86400
+        self.timelines = LRUCache(max_users)
+        self.hydrate_lock = threading.Lock()
+        # user_id -> entries added while that user's timelines are being loaded
+        self.hydrating = {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = []
+        self.inflight = []
+        self.dead_letters = deque(maxlen=CHECKIN_DEAD_LETTERS)
+        self.written = 0
+        self.dead_lettered = 0
+        self.wake = threading.Event()
+        self.thread = None
+
+    def _start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="checkin-writer", daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def add(self, user_id, checkin_type, data, signals, timestamp=None):
+        row = {
+            'uid': uuid.uuid4().hex,
+            'user_id': user_id,
+            'checkin_type': checkin_type,
+            'timestamp': timestamp or datetime.now(),
+            'data': data,
+            **{k: signals.get(k) for k in ('stress', 'energy', 'mood', 'focus')}
+        }
+        if self.thread is None:
+            self._start()
+        entry = pending_entry(row)
+        with self.lock:
+            self.pending.append(row)
+            full = len(self.pending) >= self.batch_size
+            timelines = self.timelines.get(user_id)
+            if timelines is not None and checkin_type in timelines.periods:
+                timelines.add(row['timestamp'].timestamp(), checkin_type, entry)
+            captured = self.hydrating.get(user_id)
+            if captured is not None:
+                captured.append((row['timestamp'].timestamp(), entry))
+        if full:
+            self.wake.set()
+        return entry
+
+    def flush(self):
+        """Commit every buffered row in one transaction; returns the number written
+
+        If the batch is rejected its rows are retried one at a time, so a
+        single bad row cannot hold back the rest: rows the table refuses are
+        moved to `dead_letters`, while rows hit by an operational error (the
+        database is locked or unreachable) go back to the buffer for the next
+        flush.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                self.inflight = batch
+            if not batch:
+                return 0
+            with self.app.app_context():
+                try:
+                    db.session.add_all([Checkin(**row) for row in batch])
+                    db.session.commit()
+                    written = len(batch)
+                    retry = []
+                except Exception as e:
+                    print(f" Check-in flush error, retrying {len(batch)} rows one at a time: {e}")
+                    db.session.rollback()
+                    written, retry = self._flush_rows(batch)
+            with self.lock:
+                self.pending[:0] = retry
+                self.inflight = []
+                self.written += written
+            return written
+
+    def _flush_rows(self, rows):
+        """Commit rows individually; returns (rows written, rows to retry later)"""
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                db.session.add(Checkin(**row))
+                db.session.commit()
+                written += 1
+            except OperationalError as e:
+                db.session.rollback()
+                print(f" Check-in flush error ({len(rows) - i} rows kept for retry): {e}")
+                return written, rows[i:]
+            except Exception as e:
+                db.session.rollback()
+                # The driver's message, without the statement and its bound values
+                error = str(getattr(e, 'orig', None) or e)
+                print(f" Check-in {row['uid']} rejected by the table, dead-lettered: {error}")
+                with self.lock:
+                    self.dead_letters.append({'row': row, 'error': error})
+                    self.dead_lettered += 1
+        return written, []
+
+    def stats(self):
+        """Write-behind counters and the most recent rows the table rejected"""
+        with self.lock:
+            return {
+                "pending": len(self.pending) + len(self.inflight),
+                "written": self.written,
+                "dead_lettered": self.dead_lettered,
+                "dead_letters": [
+                    {
+                        "id": item['row']['uid'],
+                        "user_id": item['row']['user_id'],
+                        "type": item['row']['checkin_type'],
+                        "timestamp": item['row']['timestamp'].isoformat(),
+                        "error": item['error']
+                    }
+                    for item in list(self.dead_letters)[-20:]
+                ]
+            }
+
+    def _user_timelines(self, user_id):
+        """In-memory timelines for a user, (re)loaded from the table when missing or stale"""
+        timelines = self.timelines.get(user_id)
+        if timelines is not None and time.time() - timelines.loaded_at < self.timeline_ttl:
+            return timelines
+        with self.hydrate_lock:
+            timelines = self.timelines.get(user_id)
+            if timelines is not None and time.time() - timelines.loaded_at < self.timeline_ttl:
+                return timelines
+            now = datetime.now()
+            horizon = now - timedelta(days=self.hot_days)
+            timelines = UserTimelines(horizon.timestamp(), self.rolling_window, now.timestamp())
+            # Capture the buffer and every later add() before querying, so a row
+            # committed while the query runs is still seen once
+            with self.lock:
+                captured = self.hydrating[user_id] = [
+                    (row['timestamp'].timestamp(), pending_entry(row))
+                    for row in self.inflight + self.pending if row['user_id'] == user_id
+                ]
+            loaded = set()
+            try:
+                query = Checkin.query.filter(
+                    Checkin.user_id == user_id,
+                    Checkin.checkin_type.in_(CHECKIN_PERIODS),
+                    Checkin.timestamp >= horizon
+                ).order_by(Checkin.timestamp)
+                for checkin in query:
+                    timelines.periods[checkin.checkin_type].add(checkin.timestamp.timestamp(), checkin.to_dict())
+                    loaded.add(checkin.uid)
+            except Exception:
+                with self.lock:
+                    del self.hydrating[user_id]
+                raise
+            with self.lock:
+                del self.hydrating[user_id]
+                for ts, entry in captured:
+                    if entry['id'] not in loaded and entry['type'] in timelines.periods and ts >= timelines.horizon:
+                        timelines.periods[entry['type']].add(ts, entry)
+                        loaded.add(entry['id'])
+                timelines.start_rolling(now.timestamp())
+                self.timelines.put(user_id, timelines)
+            return timelines
+
+    def _catch_up(self, user_id, timelines):
+        """Merge rows other processes committed since the last sync, via the index"""
+        started = time.time()
+        since = timelines.synced - self.sync_lag
+        rows = Checkin.query.filter(
+            Checkin.user_id == user_id,
+            Checkin.checkin_type.in_(CHECKIN_PERIODS),
+            Checkin.timestamp >= datetime.fromtimestamp(since)
+        ).order_by(Checkin.timestamp).all()
+        with self.lock:
+            known = {}
+            for checkin in rows:
+                ts = checkin.timestamp.timestamp()
+                if ts < timelines.horizon:
+                    continue
+                timeline = timelines.periods[checkin.checkin_type]
+                if checkin.checkin_type not in known:
+                    known[checkin.checkin_type] = {entry['id'] for entry in timeline.window(since)}
+                if checkin.uid not in known[checkin.checkin_type]:
+                    timelines.add(ts, checkin.checkin_type, checkin.to_dict())
+                    known[checkin.checkin_type].add(checkin.uid)
+            timelines.synced = max(timelines.synced, started)
+
+    def _maybe_catch_up(self, user_id, timelines):
+        """_catch_up(), at most once every `catch_up_interval` seconds per user"""
+        if time.time() - timelines.synced >= self.catch_up_interval:
+            self._catch_up(user_id, timelines)
+
+    def range(self, user_id, since, until=None, periods=CHECKIN_PERIODS):
+        """{period: [entry, ...]} for check-ins in [since, until), oldest first
+
+        Windows inside the hot window are answered from the in-memory
+        timelines with binary search; older ones fall back to scan().
+        """
+        timelines = self._user_timelines(user_id)
+        since_ts = since.timestamp()
+        if since_ts < timelines.horizon:
+            return self.scan(user_id, since, until, periods)
+        self._maybe_catch_up(user_id, timelines)
+        until_ts = None if until is None else until.timestamp()
+        with self.lock:
+            return {period: timelines.periods[period].window(since_ts, until_ts) for period in periods}
+
+    def compact(self, now):
+        """Free in-memory check-ins that have aged out of the hot window
+
+        The table keeps every row, so older windows are still answered by scan().
+        """
+        cutoff = now - self.hot_days * 86400
+        dropped = 0
+        for timelines in self.timelines.values():
+            with self.lock:
+                for timeline in timelines.periods.values():
+                    dropped += timeline.trim(cutoff)
+                timelines.horizon = max(timelines.horizon, cutoff)
+                timelines.rolling.expire(now)
+        return dropped
+
+    def rolling_totals(self, user_id):
+        """Check-in count and stress/energy sums over the rolling window, overall and per period
+
+        This process's own check-ins are counted as soon as add() returns; rows
+        from other processes are picked up by a catch-up that runs at most every
+        `catch_up_interval` seconds. Each catch-up re-reads from the last sync
+        minus `sync_lag`, so skipped reads do not lose rows.
+        """
+        timelines = self._user_timelines(user_id)
+        self._maybe_catch_up(user_id, timelines)
+        with self.lock:
+            return timelines.rolling.totals(datetime.now().timestamp())
+
+    def scan(self, user_id, since, until=None, periods=CHECKIN_PERIODS):
+        """range() straight from the table, via the (user_id, checkin_type, timestamp) index"""
+        history = {period: [] for period in periods}
+        seen = set()
+        # Snapshot the buffer before querying: a row committed in between then
+        # shows up in both and is de-duplicated, rather than in neither.
+        with self.lock:
+            unsaved = self.inflight + self.pending
+        query = Checkin.query.filter(
+            Checkin.user_id == user_id,
+            Checkin.checkin_type.in_(periods),
+            Checkin.timestamp >= since
+        )
+        if until is not None:
+            query = query.filter(Checkin.timestamp < until)
+        for checkin in query.order_by(Checkin.timestamp):
+            history[checkin.checkin_type].append(checkin.to_dict())
+            seen.add(checkin.uid)
+
+        merged = False
+        for row in unsaved:
+            if (row['user_id'] == user_id and row['checkin_type'] in history and row['uid'] not in seen
+                    and row['timestamp'] >= since and (until is None or row['timestamp'] < until)):
+                history[row['checkin_type']].append(pending_entry(row))
+                merged = True
+        if merged:
+            for entries in history.values():
+                entries.sort(key=lambda entry: entry['timestamp'])
+        return history
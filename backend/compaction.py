@@ -0,0 +1,47 @@
+import threading
+import time
+
+
+class Compactor:
+    """Runs registered compaction tasks on a background thread every `interval` seconds
+
+    Each task is called as fn(now) with the current epoch time and returns the
+    number of records it compacted.
+    """
+
+    def __init__(self, interval=3600, context=None):
+        self.interval = interval
+        self.context = context
+        self.tasks = []
+        self.thread = None
+
+    def add(self, name, fn):
+        self.tasks.append((name, fn))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="compactor", daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+    def run_once(self):
+        now = time.time()
+        compacted = {}
+        for name, fn in self.tasks:
+            try:
+                if self.context is None:
+                    compacted[name] = fn(now)
+                else:
+                    with self.context():
+                        compacted[name] = fn(now)
+            except Exception as e:
+                print(f" Compaction of {name} failed: {e}")
+                continue
+            if compacted[name]:
+                print(f" Compacted {compacted[name]} {name} records")
+        return compacted
@@ -0,0 +1,504 @@
+"""Local stand-ins for the upstream APIs app.py talks to.
+
+Run one from the command line and point the backend at it, e.g.
+
+    python fake_upstreams.py calendar --port 8091
+    GOOGLE_API_ROOT_URL=http://127.0.0.1:8091/ python app.py
+
+    python fake_upstreams.py groq --port 8092 --latency 0.8 --error-rate 0.05
+    GROQ_API_URL=http://127.0.0.1:8092/openai/v1/chat/completions python app.py
+
+Every fake accepts --latency (seconds added to each response), --error-rate
+(fraction of requests answered with --error-status) and --size (items per
+response). bench.py starts all of them itself.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email import message_from_bytes
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import requests
+
+
+class FakeUpstream:
+    """Threaded HTTP server that dispatches (method, path) to handler methods
+
+    route() returns (status, payload) for a JSON body, or (status, chunks,
+    content_type) to stream a list of text chunks. Requests whose body is not
+    JSON can be answered by overriding route_raw(), which gets the headers and
+    the undecoded body first.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, error_status=500, size=10):
+        upstream = self
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.size = size
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                upstream._dispatch(self, 'GET')
+
+            def do_POST(self):
+                upstream._dispatch(self, 'POST')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, method, path, query, body):
+        """Return (status, payload) for a request; subclasses override"""
+        return 404, {"error": "not found"}
+
+    def route_raw(self, method, path, headers, raw):
+        """Result for a request that route() cannot handle, or None to fall through to route()"""
+        return None
+
+    def _dispatch(self, handler, method):
+        parsed = urlparse(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        raw = handler.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        self.requests += 1
+
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.8, 1.2))
+        if self.error_rate and random.random() < self.error_rate:
+            result = (self.error_status, {"error": {"message": "injected failure", "code": self.error_status}})
+        else:
+            result = self.route_raw(method, parsed.path, handler.headers, raw)
+            if result is None:
+                result = self.route(method, parsed.path, query, body)
+
+        if len(result) == 3:
+            status, chunks, content_type = result
+            handler.send_response(status)
+            handler.send_header('Content-Type', content_type)
+            handler.end_headers()
+            for chunk in chunks:
+                handler.wfile.write(chunk.encode())
+                handler.wfile.flush()
+            return
+
+        status, payload = result
+        data = json.dumps(payload).encode() if status != 204 else b''
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+class FakeCalendar(FakeUpstream):
+    """Google Calendar v3 subset: events.list with sync tokens, insert, watch, channels.stop and batch"""
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        super().__init__(host, port, **options)
+        self.lock = threading.Lock()
+        self.events = {}
+        self.changes = []
+        self.channels = {}
+
+    def add_event(self, summary, start, minutes=60, description='', notify=True):
+        """Create or update an event and push a notification to every watch channel"""
+        item = {
+            'id': uuid.uuid4().hex,
+            'status': 'confirmed',
+            'summary': summary,
+            'description': description,
+            'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + timedelta(minutes=minutes)).isoformat()},
+            'htmlLink': ''
+        }
+        self._record(item)
+        if notify:
+            self.notify()
+        return item
+
+    def cancel_event(self, event_id, notify=True):
+        self._record({'id': event_id, 'status': 'cancelled'})
+        if notify:
+            self.notify()
+
+    def _record(self, item):
+        with self.lock:
+            if item['status'] == 'cancelled':
+                self.events.pop(item['id'], None)
+            else:
+                self.events[item['id']] = item
+            self.changes.append(item)
+
+    def notify(self, state='exists', channel_ids=None):
+        """POST a Calendar-style push notification to every registered channel, or just channel_ids"""
+        for channel in list(self.channels.values()):
+            if channel_ids is not None and channel['id'] not in channel_ids:
+                continue
+            channel['message_number'] += 1
+            requests.post(channel['address'], headers={
+                'X-Goog-Channel-ID': channel['id'],
+                'X-Goog-Channel-Token': channel.get('token') or '',
+                'X-Goog-Resource-ID': channel['resource_id'],
+                'X-Goog-Resource-State': state,
+                'X-Goog-Message-Number': str(channel['message_number'])
+            }, timeout=5)
+
+    def route(self, method, path, query, body):
+        prefix = '/calendar/v3/calendars/primary/events'
+        if method == 'GET' and path == prefix:
+            return 200, self._list(query)
+        if method == 'POST' and path == prefix:
+            item = dict(body, id=uuid.uuid4().hex, status='confirmed', htmlLink='')
+            self._record(item)
+            return 200, item
+        if method == 'POST' and path == prefix + '/watch':
+            channel = dict(body, resource_id=uuid.uuid4().hex, message_number=0)
+            self.channels[body['id']] = channel
+            expiration = datetime.now(timezone.utc) + timedelta(seconds=int(body.get('params', {}).get('ttl', 3600)))
+            return 200, {
+                'kind': 'api#channel', 'id': body['id'], 'resourceId': channel['resource_id'],
+                'expiration': str(int(expiration.timestamp() * 1000))
+            }
+        if method == 'POST' and path == '/calendar/v3/channels/stop':
+            self.channels.pop(body.get('id'), None)
+            return 204, {}
+        return super().route(method, path, query, body)
+
+    def route_raw(self, method, path, headers, raw):
+        if method == 'POST' and path == '/batch/calendar/v3':
+            return self._batch(headers.get('Content-Type', ''), raw)
+        return None
+
+    def _batch(self, content_type, raw):
+        """Answer a multipart/mixed batch by running each application/http part through route()"""
+        message = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + raw)
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for part in message.get_payload():
+            request_text = part.get_payload()
+            head, _, body = request_text.partition('\r\n\r\n')
+            if not _:
+                head, _, body = request_text.partition('\n\n')
+            method, target = head.splitlines()[0].split(' ')[:2]
+            parsed = urlparse(target)
+            try:
+                payload = json.loads(body) if body.strip() else {}
+            except ValueError:
+                payload = {}
+            query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            status, result = self.route(method, parsed.path, query, payload)[:2]
+            content_id = part['Content-ID'] or ''
+            chunks.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(result) if status != 204 else ''}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return 200, chunks, f"multipart/mixed; boundary={boundary}"
+
+    def _list(self, query):
+        page_size = int(query.get('maxResults', 250))
+        offset = int(query.get('pageToken', 0))
+        with self.lock:
+            if 'syncToken' in query:
+                items = self.changes[int(query['syncToken']):]
+            else:
+                items = list(self.events.values())
+            token = str(len(self.changes))
+
+        page = {'kind': 'calendar#events', 'items': items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            page['nextPageToken'] = str(offset + page_size)
+        else:
+            page['nextSyncToken'] = token
+        return page
+
+
+class FakeGroq(FakeUpstream):
+    """OpenAI-compatible chat completions returning one JSON object every app.py prompt can read
+
+    --size sets how many recommendations, patterns and searches each answer holds.
+    """
+
+    def completion(self):
+        n = max(1, self.size)
+        return {
+            "stress_level": "moderate",
+            "stress_score": 5,
+            "burnout_risk": "low",
+            "mood_state": "coping",
+            "energy_forecast": "moderate",
+            "key_patterns": [f"pattern {i}" for i in range(n)],
+            "wellness_recommendations": [
+                {"action": f"action {i}", "priority": "medium", "reasoning": "fake"} for i in range(n)
+            ],
+            "recommended_music_genres": ["ambient", "lo-fi", "classical"],
+            "detailed_assessment": "Fake assessment from the local Groq stand-in.",
+            "recommended_breaks": [{
+                "time_slot": "15:00 - 15:10",
+                "break_type": "walk",
+                "duration_minutes": 10,
+                "reasoning": "fake",
+                "reason_tag": "Focus Reset",
+                "ui_message": "Stretch your legs",
+                "confidence": 0.8
+            }],
+            "daily_strategy": "Pace yourself",
+            "mood_trend": "stable",
+            "mood_score": 6,
+            "key_insights": ["fake insight"],
+            "recommendations": [{"action": "fake", "priority": "medium", "reasoning": "fake"}],
+            "motivational_message": "Keep going",
+            "primary_mood_category": "calm",
+            "therapeutic_goal": "fake goal",
+            "recommended_genres": [f"genre{i}" for i in range(n)],
+            "recommended_artists": [f"Artist {i}" for i in range(n)],
+            "recommended_tracks": [
+                {"artist": f"Artist {i}", "track": f"Track {i}", "reason": "fake"} for i in range(n)
+            ],
+            "playlist_structure": {},
+            "tempo_recommendation": "slow",
+            "listening_context": "background",
+            "therapeutic_explanation": "fake",
+            "avoid_genres": [],
+            "session_duration": "30 min",
+            "primary_video_category": "meditation",
+            "recommended_searches": [
+                {"query": f"guided meditation {i}", "reason": "fake", "priority": "high"} for i in range(n)
+            ],
+            "video_duration_preference": "5-10 min",
+            "viewing_context": "immediate relief",
+            "avoid_content": []
+        }
+
+    def route(self, method, path, query, body):
+        if method == 'POST' and path.endswith('/chat/completions'):
+            content = json.dumps(self.completion())
+            usage = {"prompt_tokens": 500, "completion_tokens": len(content) // 4}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            if body.get('stream'):
+                chunks = [
+                    "data: " + json.dumps({"choices": [{"delta": {"content": content[i:i + 40]}}]}) + "\n\n"
+                    for i in range(0, len(content), 40)
+                ]
+                chunks.append("data: " + json.dumps({"choices": [], "x_groq": {"usage": usage}}) + "\n\n")
+                chunks.append("data: [DONE]\n\n")
+                return 200, chunks, 'text/event-stream'
+            return 200, {
+                "id": uuid.uuid4().hex,
+                "model": body.get('model'),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            }
+        return super().route(method, path, query, body)
+
+
+class FakeNotion(FakeUpstream):
+    """Notion databases.query with cursor pagination and the last_edited_time filter
+
+    Holds --size open tasks spread over the next week.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        super().__init__(host, port, **options)
+        now = datetime.now(timezone.utc)
+        edited = now.strftime("%Y-%m-%dT%H:%M:00.000Z")
+        self.pages = [self.page(i, now + timedelta(hours=6 * i - 12), edited) for i in range(self.size)]
+
+    def page(self, i, due, edited):
+        return {
+            "object": "page",
+            "id": f"task-{i}",
+            "archived": False,
+            "last_edited_time": edited,
+            "properties": {
+                "Name": {"title": [{"plain_text": f"Task {i}"}]},
+                "Due date": {"date": {"start": due.date().isoformat()}},
+                "Priority Level": {"select": {"name": ("High", "Medium", "Low")[i % 3]}},
+                "Status": {"status": {"name": "In progress" if i % 2 else "Not started"}},
+                "Type": {"rich_text": [{"plain_text": "Work"}]}
+            }
+        }
+
+    def route(self, method, path, query, body):
+        if method == 'POST' and path.startswith('/v1/databases/') and path.endswith('/query'):
+            pages = self.pages
+            edited = body.get('filter', {}).get('last_edited_time', {}).get('on_or_after')
+            if edited:
+                pages = [page for page in pages if page['last_edited_time'] >= edited]
+            offset = int(body.get('start_cursor') or 0)
+            page_size = int(body.get('page_size', 100))
+            more = offset + page_size < len(pages)
+            return 200, {
+                "object": "list",
+                "results": pages[offset:offset + page_size],
+                "has_more": more,
+                "next_cursor": str(offset + page_size) if more else None
+            }
+        return super().route(method, path, query, body)
+
+
+class FakeSpotify(FakeUpstream):
+    """Spotify Web API subset: search, me and playlist creation"""
+
+    def track(self, query, i):
+        track_id = uuid.uuid4().hex[:22]
+        return {
+            "name": f"{query} {i}",
+            "artists": [{"name": f"Artist {i}"}],
+            "uri": f"spotify:track:{track_id}",
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+            "popularity": random.randint(0, 100),
+            "album": {"name": "Fake Album", "images": [{"url": "https://i.scdn.co/image/fake"}]}
+        }
+
+    def playlist(self, query, i):
+        return {
+            "name": f"{query} playlist {i}",
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{i}"},
+            "tracks": {"total": 50},
+            "description": "fake",
+            "images": [],
+            "owner": {"display_name": "fake"}
+        }
+
+    def route(self, method, path, query, body):
+        if method == 'GET' and path == '/v1/search':
+            limit = min(int(query.get('limit', 10)), self.size)
+            if query.get('type') == 'playlist':
+                return 200, {"playlists": {"items": [self.playlist(query.get('q'), i) for i in range(limit)]}}
+            return 200, {"tracks": {"items": [self.track(query.get('q'), i) for i in range(limit)]}}
+        if method == 'GET' and path.rstrip('/') == '/v1/me':
+            return 200, {"id": "fake-user", "display_name": "Fake User"}
+        if method == 'POST' and path.startswith('/v1/users/') and path.endswith('/playlists'):
+            playlist_id = uuid.uuid4().hex[:22]
+            return 201, {
+                "id": playlist_id,
+                "name": body.get('name'),
+                "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"}
+            }
+        if method == 'POST' and path.startswith('/v1/playlists/') and path.endswith('/tracks'):
+            return 201, {"snapshot_id": uuid.uuid4().hex}
+        return super().route(method, path, query, body)
+
+
+class FakeYouTube(FakeUpstream):
+    """YouTube Data API v3 search"""
+
+    def route(self, method, path, query, body):
+        if method == 'GET' and path == '/youtube/v3/search':
+            count = min(int(query.get('maxResults', 5)), self.size)
+            return 200, {"items": [{
+                "id": {"videoId": uuid.uuid4().hex[:11]},
+                "snippet": {
+                    "title": f"{query.get('q')} {i}",
+                    "description": "fake",
+                    "thumbnails": {"high": {"url": "https://i.ytimg.com/vi/fake/hqdefault.jpg"}},
+                    "channelTitle": "Fake Channel",
+                    "publishedAt": "2024-01-01T00:00:00Z"
+                }
+            } for i in range(count)]}
+        return super().route(method, path, query, body)
+
+
+FAKES = {
+    'calendar': FakeCalendar,
+    'groq': FakeGroq,
+    'notion': FakeNotion,
+    'spotify': FakeSpotify,
+    'youtube': FakeYouTube
+}
+
+def fake_env(name, url):
+    """Environment variables that point app.py at a fake listening on url"""
+    base = url.rstrip('/')
+    return {
+        'calendar': {'GOOGLE_API_ROOT_URL': url},
+        'groq': {'GROQ_API_URL': f"{base}/openai/v1/chat/completions"},
+        'notion': {'NOTION_API_URL': f"{base}/v1"},
+        'spotify': {'SPOTIFY_API_URL': f"{base}/v1/"},
+        'youtube': {'YOUTUBE_API_URL': f"{base}/youtube/v3"}
+    }[name]
+
+
+def write_fake_token(path):
+    """Write an authorized-user token file that will not need refreshing for a day"""
+    with open(path, 'w') as token:
+        json.dump({
+            'token': 'fake-access-token',
+            'refresh_token': 'fake-refresh-token',
+            'client_id': 'fake-client',
+            'client_secret': 'fake-secret',
+            'expiry': (datetime.utcnow() + timedelta(days=1)).isoformat() + 'Z'
+        }, token)
+
+
+FAKE_SPOTIFY_SCOPE = (
+    "user-library-read user-top-read playlist-modify-public playlist-modify-private "
+    "user-read-private user-read-email"
+)
+
+
+def write_fake_spotify_cache(path, scope=FAKE_SPOTIFY_SCOPE):
+    """Write a spotipy token cache that validates without contacting Spotify"""
+    with open(path, 'w') as cache:
+        json.dump({
+            'access_token': 'fake-spotify-token',
+            'token_type': 'Bearer',
+            'expires_in': 3600,
+            'refresh_token': 'fake-refresh-token',
+            'scope': scope,
+            'expires_at': int(time.time()) + 86400
+        }, cache)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('upstream', choices=sorted(FAKES))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8091)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--size', type=int, default=10)
+    args = parser.parse_args()
+
+    fake = FAKES[args.upstream](
+        args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+        error_status=args.error_status, size=args.size
+    )
+    print(f"Fake {args.upstream} listening on {fake.url}")
+    for name, value in fake_env(args.upstream, fake.url).items():
+        print(f"  {name}={value}")
+    fake.server.serve_forever()
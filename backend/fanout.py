@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+def deadline_in(seconds):
+    return time.monotonic() + seconds
+
+
+class FanOut:
+    """Runs independent upstream calls concurrently against one shared deadline
+
+    `context` is an optional factory (e.g. app.app_context) entered around every
+    call, so workers get their own application context and database session.
+    Calls must not fan out again from inside a worker.
+    """
+
+    def __init__(self, max_workers=16, context=None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        self.context = context
+
+    def _call(self, fn, args):
+        if self.context is None:
+            return fn(*args)
+        with self.context():
+            return fn(*args)
+
+    def run(self, calls, deadline, defaults=None):
+        """Run {name: (fn, *args)} concurrently and return {name: result}
+
+        A call that raises or is still running at `deadline` (monotonic) yields
+        defaults[name] instead; the caller never waits past the deadline.
+        """
+        defaults = defaults or {}
+        futures = {name: self.pool.submit(self._call, call[0], call[1:]) for name, call in calls.items()}
+        wait(futures.values(), timeout=max(0, deadline - time.monotonic()))
+
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                future.cancel()
+                print(f" Fan-out call {name} missed its deadline")
+                results[name] = defaults.get(name)
+            elif future.exception() is not None:
+                print(f" Fan-out call {name} failed: {future.exception()}")
+                results[name] = defaults.get(name)
+            else:
+                results[name] = future.result()
+        return results
+
+    def map(self, fn, items, deadline, default=None):
+        """[fn(item) for item in items] run concurrently, in input order"""
+        calls = {i: (fn, item) for i, item in enumerate(items)}
+        results = self.run(calls, deadline, {i: default for i in calls})
+        return [results[i] for i in range(len(calls))]
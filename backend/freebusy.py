@@ -0,0 +1,70 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+
+class FreeBusy:
+    """Disjoint, sorted busy intervals (epoch seconds) with binary-search gap queries"""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        self.labels = []
+        for start, end, label in sorted(intervals, key=lambda interval: interval[0]):
+            if end <= start:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+                self.labels.append(label)
+
+    @classmethod
+    def from_events(cls, events):
+        """Build from parsed calendar Events, skipping events marked as free"""
+        return cls(
+            (event.start_ts, event.end_ts, event.summary)
+            for event in events
+            if event.transparency != 'transparent'
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_free(self, start, end):
+        """True when no busy interval overlaps [start, end)"""
+        i = bisect_right(self.starts, start) - 1
+        if i >= 0 and self.ends[i] > start:
+            return False
+        return i + 1 >= len(self.starts) or self.starts[i + 1] >= end
+
+    def gaps(self, window_start, window_end, min_seconds=0):
+        """Free (start, end, next_label) gaps inside a window, in O(log n + gaps in window)"""
+        if window_end <= window_start:
+            return []
+
+        # First busy interval that ends after the window opens
+        i = bisect_right(self.ends, window_start)
+        last = bisect_left(self.starts, window_end)
+        cursor = window_start
+        found = []
+        while i < last:
+            if self.starts[i] - cursor >= min_seconds and self.starts[i] > cursor:
+                found.append((cursor, self.starts[i], self.labels[i]))
+            cursor = max(cursor, self.ends[i])
+            i += 1
+        if window_end - cursor >= min_seconds and window_end > cursor:
+            found.append((cursor, window_end, None))
+        return found
+
+    def free_slots(self, days=1, min_minutes=15, day_start_hour=9, day_end_hour=18, now=None):
+        """Gaps of at least min_minutes within working hours over the next `days` days"""
+        now = now or datetime.now()
+        slots = []
+        for offset in range(days):
+            day = now.date() + timedelta(days=offset)
+            work_start = datetime.combine(day, datetime.min.time()).replace(hour=day_start_hour)
+            work_end = datetime.combine(day, datetime.min.time()).replace(hour=day_end_hour)
+            window_start = max(now, work_start).timestamp()
+            slots.extend(self.gaps(window_start, work_end.timestamp(), min_minutes * 60))
+        return slots
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+
+# Refresh access tokens this long before they expire so requests never
+# stall on a refresh round trip.
+REFRESH_MARGIN = timedelta(minutes=5)
+
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+
+def get_discovery_document(api, version):
+    """Parsed discovery document, loaded once per process"""
+    key = (api, version)
+    with _discovery_lock:
+        if key not in _discovery_docs:
+            try:
+                doc = discovery_cache.get_static_doc(api, version)
+            except Exception:
+                doc = None
+            _discovery_docs[key] = json.loads(doc) if doc else None
+        return _discovery_docs[key]
+
+
+class GoogleServiceClient:
+    """Shared Google credentials plus per-thread API service objects"""
+
+    def __init__(self, api, version, scopes, token_file=None, root_url=None, token_info=None, on_refresh=None):
+        self.api = api
+        self.root_url = root_url
+        self.version = version
+        self.scopes = scopes
+        self.token_file = token_file
+        self.token_info = token_info
+        self.on_refresh = on_refresh
+        self.creds = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _load(self):
+        if self.token_info:
+            return Credentials.from_authorized_user_info(self.token_info, self.scopes)
+        if self.token_file and os.path.exists(self.token_file):
+            creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+            print(f"Loaded credentials from {self.token_file}")
+            return creds
+        return None
+
+    def _needs_refresh(self, creds):
+        if not creds.token:
+            return True
+        if creds.expiry is None:
+            return False
+        return creds.expiry - datetime.utcnow() <= REFRESH_MARGIN
+
+    def credentials(self):
+        """Cached credentials, refreshed ahead of expiry; None when unavailable"""
+        with self.lock:
+            if self.creds is None:
+                try:
+                    self.creds = self._load()
+                except Exception as e:
+                    print(f"Error loading credentials: {e}")
+                    return None
+                if self.creds is None:
+                    return None
+
+            if self._needs_refresh(self.creds):
+                if not self.creds.refresh_token:
+                    print(" Credentials invalid")
+                    return None
+                try:
+                    print(" Token expiring, refreshing...")
+                    self.creds.refresh(Request())
+                    if self.on_refresh:
+                        self.on_refresh(self.creds.to_json())
+                    elif self.token_file:
+                        with open(self.token_file, 'w') as token:
+                            token.write(self.creds.to_json())
+                    print("Token refreshed!")
+                except Exception as e:
+                    print(f" Token refresh failed: {e}")
+                    return None
+            return self.creds
+
+    def service(self):
+        """API service for the calling thread, built from the cached discovery document"""
+        creds = self.credentials()
+        if not creds:
+            return None
+
+        service = getattr(self.local, 'service', None)
+        if service is None or self.local.creds is not creds:
+            doc = get_discovery_document(self.api, self.version)
+            if doc and self.root_url:
+                doc = dict(doc, rootUrl=self.root_url)
+            if doc:
+                service = build_from_document(doc, credentials=creds)
+            else:
+                service = build(self.api, self.version, credentials=creds)
+            self.local.service = service
+            self.local.creds = creds
+        return service
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from singleflight import SingleFlight
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+def extract_json(text):
+    """Parse the JSON object in a completion, tolerating code fences or prose around it"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object in completion")
+    return json.loads(text[start:end + 1])
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` units per second up to `capacity`"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.available = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount, deadline):
+        """Block until `amount` units are available or raise once `deadline` (monotonic) passes"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"rate limit wait of {wait:.1f}s exceeds deadline")
+            time.sleep(min(wait, 1.0))
+
+    def refund(self, amount):
+        with self.lock:
+            self.available = min(self.capacity, self.available + amount)
+
+
+class GroqClient:
+    """Pooled Groq chat client with retries, client-side rate limiting and usage accounting"""
+
+    def __init__(self, api_key, url=GROQ_API_URL, requests_per_minute=30, tokens_per_minute=6000,
+                 max_retries=3, pool_size=10):
+        self.api_key = api_key
+        self.url = url
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+        self.inflight = SingleFlight()
+
+    def _record(self, label, latency, usage, ok, retries):
+        with self.stats_lock:
+            entry = self.stats.setdefault(label, {
+                "calls": 0, "failures": 0, "retries": 0, "latency_total": 0.0, "latency_max": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0
+            })
+            entry["calls"] += 1
+            entry["failures"] += 0 if ok else 1
+            entry["retries"] += retries
+            entry["latency_total"] += latency
+            entry["latency_max"] = max(entry["latency_max"], latency)
+            entry["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            entry["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def usage_stats(self):
+        """Per-label call counts, latency and token totals"""
+        with self.stats_lock:
+            return {
+                label: dict(entry, latency_avg=round(entry["latency_total"] / entry["calls"], 3))
+                for label, entry in self.stats.items()
+            }
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def chat(self, payload, timeout=30, label="chat"):
+        """POST a chat completion and return the decoded response body
+
+        Concurrent calls with an identical payload share a single request.
+        """
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        return self.inflight.do(key, self._chat, payload, timeout, label)
+
+    def _chat(self, payload, timeout, label):
+        estimate = sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4 + payload.get("max_tokens", 0)
+        deadline = time.monotonic() + timeout
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        started = time.monotonic()
+        attempt = 0
+        usage = {}
+        try:
+            while True:
+                self.request_bucket.acquire(1, deadline)
+                self.token_bucket.acquire(estimate, deadline)
+                response = None
+                try:
+                    response = self.session.post(
+                        self.url, headers=headers, json=payload,
+                        timeout=max(1.0, deadline - time.monotonic())
+                    )
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        body = response.json()
+                        usage = body.get("usage", {})
+                        used = usage.get("total_tokens")
+                        if used is not None and used < estimate:
+                            self.token_bucket.refund(estimate - used)
+                        self._record(label, time.monotonic() - started, usage, True, attempt)
+                        return body
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    print(f" Groq {label} attempt {attempt + 1} failed: {e}")
+                    if attempt >= self.max_retries:
+                        raise
+
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+                delay = self._backoff(attempt, response)
+                if time.monotonic() + delay > deadline:
+                    if response is not None:
+                        response.raise_for_status()
+                    raise requests.Timeout(f"Groq {label} retries exceeded the {timeout}s deadline")
+                if response is not None:
+                    print(f" Groq {label} returned {response.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+        except Exception:
+            self._record(label, time.monotonic() - started, usage, False, attempt)
+            raise
+
+    def stream_chat(self, payload, timeout=30, label="chat", usage_sink=None):
+        """Stream a chat completion, yielding content deltas as they arrive
+
+        Retries only happen before the first delta; once content has been
+        yielded a failure is raised to the caller. The reported token usage is
+        copied into `usage_sink` when one is given.
+        """
+        estimate = sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4 + payload.get("max_tokens", 0)
+        deadline = time.monotonic() + timeout
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        payload = dict(payload, stream=True)
+        started = time.monotonic()
+        attempt = 0
+        usage = {}
+        try:
+            while True:
+                self.request_bucket.acquire(1, deadline)
+                self.token_bucket.acquire(estimate, deadline)
+                response = None
+                try:
+                    response = self.session.post(
+                        self.url, headers=headers, json=payload, stream=True,
+                        timeout=max(1.0, deadline - time.monotonic())
+                    )
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        break
+                    response.close()
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    print(f" Groq {label} attempt {attempt + 1} failed: {e}")
+                    if attempt >= self.max_retries:
+                        raise
+
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+                delay = self._backoff(attempt, response)
+                if time.monotonic() + delay > deadline:
+                    if response is not None:
+                        response.raise_for_status()
+                    raise requests.Timeout(f"Groq {label} retries exceeded the {timeout}s deadline")
+                if response is not None:
+                    print(f" Groq {label} returned {response.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    # Groq reports usage on the final chunk under x_groq
+                    usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage") or usage
+                    for choice in chunk.get("choices", []):
+                        delta = choice.get("delta", {}).get("content")
+                        if delta:
+                            yield delta
+
+            used = usage.get("total_tokens")
+            if used is not None and used < estimate:
+                self.token_bucket.refund(estimate - used)
+            self._record(label, time.monotonic() - started, usage, True, attempt)
+        except Exception:
+            self._record(label, time.monotonic() - started, usage, False, attempt)
+            raise
+        finally:
+            if usage_sink is not None:
+                usage_sink.update(usage)
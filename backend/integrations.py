@@ -0,0 +1,226 @@
+import json
+import threading
+import requests
+import spotipy  # type: ignore
+from spotipy.cache_handler import CacheHandler  # type: ignore
+from spotipy.oauth2 import SpotifyOAuth  # type: ignore
+from cache import LRUCache
+from calendar_sync import CalendarEventStore
+from google_client import GoogleServiceClient
+from models import db, User
+from notion_sync import NOTION_API_URL, NotionTaskStore
+
+DEFAULT_USER = "default_user"
+MAX_INTEGRATION_CLIENTS = 256
+
+
+def find_user(user_id):
+    """User row for a numeric id or email, or None"""
+    if user_id is None or user_id == DEFAULT_USER:
+        return None
+    try:
+        if str(user_id).isdigit():
+            return db.session.get(User, int(user_id))
+        return User.query.filter_by(email=user_id).first()
+    except Exception as e:
+        print(f"User lookup error for {user_id}: {e}")
+        return None
+
+
+def save_user_token(user_id, field, value):
+    """Persist a refreshed provider token back onto the user's row"""
+    try:
+        user = find_user(user_id)
+        if user:
+            setattr(user, field, value)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Token save error for {user_id}: {e}")
+
+
+class UserSpotifyCacheHandler(CacheHandler):
+    """Spotify token cache backed by the users.spotify_token column"""
+
+    def __init__(self, user_id, token_info):
+        self.user_id = user_id
+        self.token_info = token_info
+
+    def get_cached_token(self):
+        return self.token_info
+
+    def save_token_to_cache(self, token_info):
+        self.token_info = token_info
+        save_user_token(self.user_id, 'spotify_token', json.dumps(token_info))
+
+
+class CalendarIntegration:
+    def __init__(self, client):
+        self.client = client
+        self.store = CalendarEventStore()
+
+
+class NotionIntegration:
+    def __init__(self, api_key, database_id, window_days, done_statuses, base_url=NOTION_API_URL):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Notion-Version": "2022-06-28",
+            "Content-Type": "application/json"
+        })
+        self.store = NotionTaskStore(database_id, window_days=window_days, done_statuses=done_statuses)
+
+    def close(self):
+        self.session.close()
+
+
+class IntegrationRegistry:
+    """Per-user, per-provider clients held in a bounded LRU so connections stay warm"""
+
+    def __init__(self, settings, maxsize=MAX_INTEGRATION_CLIENTS):
+        self.settings = settings
+        self.clients = LRUCache(maxsize, on_evict=self._close)
+        self.channels = {}
+        self.lock = threading.Lock()
+        # Separate from self.lock: evictions run _close() while _get() holds that one
+        self.channels_lock = threading.Lock()
+
+    def _close(self, key, client):
+        if key[1] == 'calendar':
+            # The evicted mirror's channel can no longer be served; a new
+            # client starts with a full sync and must watch again
+            self.unwatch_user(key[0])
+        close = getattr(client, 'close', None)
+        if close:
+            close()
+
+    def credentials(self, user_id):
+        """Provider credentials for a user; the default user gets the process-wide configuration"""
+        if user_id == DEFAULT_USER:
+            return {
+                "google_token_info": None,
+                "notion_api_key": self.settings["notion_api_key"],
+                "notion_database_id": self.settings["notion_database_id"],
+                "spotify_token_info": None
+            }
+
+        user = find_user(user_id)
+        if not user:
+            return {}
+        return {
+            "google_token_info": json.loads(user.google_calendar_token) if user.google_calendar_token else None,
+            "notion_api_key": user.notion_api_key,
+            "notion_database_id": user.notion_database_id,
+            "spotify_token_info": json.loads(user.spotify_token) if user.spotify_token else None
+        }
+
+    def calendar(self, user_id=DEFAULT_USER):
+        """Cached Calendar client and event store for a user, or None when not connected"""
+        def build():
+            if user_id == DEFAULT_USER:
+                client = GoogleServiceClient(
+                    'calendar', 'v3', self.settings["google_scopes"],
+                    token_file=self.settings["google_token_file"],
+                    root_url=self.settings.get("google_root_url")
+                )
+            else:
+                token_info = self.credentials(user_id).get("google_token_info")
+                if not token_info:
+                    return None
+                client = GoogleServiceClient(
+                    'calendar', 'v3', self.settings["google_scopes"],
+                    root_url=self.settings.get("google_root_url"),
+                    token_info=token_info,
+                    on_refresh=lambda token: save_user_token(user_id, 'google_calendar_token', token)
+                )
+            return CalendarIntegration(client)
+
+        return self._get(user_id, 'calendar', build)
+
+    def notion(self, user_id=DEFAULT_USER):
+        """Cached Notion session and task store for a user, or None when not connected"""
+        def build():
+            creds = self.credentials(user_id)
+            if not creds.get("notion_api_key") or not creds.get("notion_database_id"):
+                return None
+            return NotionIntegration(
+                creds["notion_api_key"], creds["notion_database_id"],
+                self.settings["notion_window_days"], self.settings["notion_done_statuses"],
+                base_url=self.settings.get("notion_api_url") or NOTION_API_URL
+            )
+
+        return self._get(user_id, 'notion', build)
+
+    def spotify_oauth(self, user_id=DEFAULT_USER, **kwargs):
+        options = dict(
+            client_id=self.settings["spotify_client_id"],
+            client_secret=self.settings["spotify_client_secret"],
+            redirect_uri=self.settings["spotify_redirect_uri"],
+            scope=self.settings["spotify_scope"]
+        )
+        options.update(kwargs)
+        if user_id == DEFAULT_USER:
+            options.setdefault("cache_path", ".spotify_cache")
+        else:
+            token_info = self.credentials(user_id).get("spotify_token_info")
+            options["cache_handler"] = UserSpotifyCacheHandler(user_id, token_info)
+        return SpotifyOAuth(**options)
+
+    def spotify(self, user_id=DEFAULT_USER):
+        """Cached Spotify client with a live token, or None when the user must authenticate"""
+        key = (user_id, 'spotify')
+        cached = self.clients.get(key)
+        if cached is not None:
+            sp, oauth = cached
+            if oauth.validate_token(oauth.cache_handler.get_cached_token()):
+                return sp
+            self.clients.pop(key)
+
+        oauth = self.spotify_oauth(user_id)
+        if not oauth.validate_token(oauth.cache_handler.get_cached_token()):
+            return None
+        sp = self.spotify_client(auth_manager=oauth)
+        self.clients.put(key, (sp, oauth))
+        return sp
+
+    def spotify_client(self, **kwargs):
+        sp = spotipy.Spotify(**kwargs)
+        if self.settings.get("spotify_api_url"):
+            sp.prefix = self.settings["spotify_api_url"]
+        return sp
+
+    def _get(self, user_id, provider, build):
+        key = (user_id, provider)
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = build()
+                    if client is not None:
+                        self.clients.put(key, client)
+        return client
+
+    def watch_channel(self, channel_id, user_id):
+        with self.channels_lock:
+            self.channels[channel_id] = user_id
+
+    def unwatch_channel(self, channel_id):
+        with self.channels_lock:
+            self.channels.pop(channel_id, None)
+
+    def unwatch_user(self, user_id):
+        with self.channels_lock:
+            for channel_id in [cid for cid, owner in self.channels.items() if owner == user_id]:
+                del self.channels[channel_id]
+
+    def channel_user(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def forget(self, user_id, providers=('calendar', 'notion', 'spotify')):
+        """Drop cached clients after a user's credentials change"""
+        for provider in providers:
+            client = self.clients.pop((user_id, provider))
+            if client is not None:
+                self._close((user_id, provider), client)
@@ -0,0 +1,90 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from cache import TTLCache
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("id", "kind", "user_id", "status", "result", "error", "created_at", "finished_at", "done")
+
+    def __init__(self, kind, user_id=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobQueue:
+    """Bounded worker pool for slow background work whose results are polled by id
+
+    At most `max_workers + max_queued` jobs are outstanding at once; submit()
+    raises JobQueueFull beyond that instead of letting the backlog grow.
+    Finished jobs are kept for `retention` seconds.
+    """
+
+    def __init__(self, max_workers=4, max_queued=64, retention=3600, max_results=4096, context=None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jobs")
+        self.slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self.jobs = TTLCache(max_results, retention)
+        self.context = context
+
+    def submit(self, kind, fn, *args, user_id=None):
+        if not self.slots.acquire(blocking=False):
+            raise JobQueueFull(f"{kind} queue is full")
+        job = Job(kind, user_id)
+        self.jobs.put(job.id, job)
+        try:
+            self.pool.submit(self._run, job, fn, args)
+        except Exception:
+            self.slots.release()
+            raise
+        return job
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        started = time.monotonic()
+        try:
+            if self.context is None:
+                job.result = fn(*args)
+            else:
+                with self.context():
+                    job.result = fn(*args)
+            job.status = "done"
+        except Exception as e:
+            print(f" Job {job.kind} {job.id[:8]} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            self.slots.release()
+            job.done.set()
+        print(f" Job {job.kind} {job.id[:8]} {job.status} in {time.monotonic() - started:.2f}s")
+
+    def get(self, job_id, wait=0):
+        """Job by id, optionally blocking up to `wait` seconds for it to finish"""
+        job = self.jobs.get(job_id)
+        if job is not None and wait > 0:
+            job.done.wait(wait)
+        return job
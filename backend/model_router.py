@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from groq_client import extract_json
+
+MODEL_TIERS = {
+    "small": "llama-3.1-8b-instant",
+    "large": "llama-3.3-70b-versatile"
+}
+# USD per million (prompt, completion) tokens, used for cost reporting only
+TIER_PRICES = {
+    "small": (0.05, 0.08),
+    "large": (0.59, 0.79)
+}
+MIN_CONFIDENCE = 0.5
+
+
+class InvalidCompletion(ValueError):
+    pass
+
+
+def parse_task_tiers(spec):
+    """'stress_analysis=large,mood_analysis=small' -> {task: tier}"""
+    tiers = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            task, tier = item.split("=", 1)
+            tiers[task.strip()] = tier.strip()
+    return tiers
+
+
+class ModelRouter:
+    """Sends each task to its configured model tier and escalates weak answers to a larger one
+
+    A task runs on task_tiers.get(task, default_tier). If the answer is not a
+    JSON object with the required keys (present and not null; an empty list
+    can be a real answer, so emptiness is left to the task's own checks),
+    fails the task's validator, or scores below min_confidence, the same
+    request is retried once on escalate_to.
+    """
+
+    def __init__(self, client, tiers=None, task_tiers=None, default_tier="small", escalate_to="large",
+                 prices=None, min_confidence=MIN_CONFIDENCE):
+        self.client = client
+        self.tiers = dict(MODEL_TIERS, **(tiers or {}))
+        self.task_tiers = task_tiers or {}
+        self.default_tier = default_tier
+        self.escalate_to = escalate_to
+        self.prices = dict(TIER_PRICES, **(prices or {}))
+        self.min_confidence = min_confidence
+        self.stats_lock = threading.Lock()
+        self.tier_stats = {}
+
+    def tier_for(self, task):
+        return self.task_tiers.get(task, self.default_tier)
+
+    def model_for(self, task):
+        return self.tiers[self.tier_for(task)]
+
+    def _record(self, tier, latency, usage, ok, escalated=False):
+        prompt_price, completion_price = self.prices.get(tier, (0, 0))
+        with self.stats_lock:
+            entry = self.tier_stats.setdefault(tier, {
+                "model": self.tiers[tier], "calls": 0, "failures": 0, "escalations": 0,
+                "latency_total": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0
+            })
+            entry["calls"] += 1
+            entry["failures"] += 0 if ok else 1
+            entry["escalations"] += 1 if escalated else 0
+            entry["latency_total"] += latency
+            entry["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            entry["completion_tokens"] += usage.get("completion_tokens", 0)
+            entry["cost_usd"] += (
+                usage.get("prompt_tokens", 0) * prompt_price + usage.get("completion_tokens", 0) * completion_price
+            ) / 1_000_000
+
+    def stats(self):
+        """Per-tier call counts, escalations, latency, tokens and estimated cost"""
+        with self.stats_lock:
+            return {
+                tier: dict(
+                    entry,
+                    latency_avg=round(entry["latency_total"] / entry["calls"], 3),
+                    cost_usd=round(entry["cost_usd"], 6)
+                )
+                for tier, entry in self.tier_stats.items()
+            }
+
+    def check(self, result, required=(), validate=None, confidence=None):
+        """Reason a parsed answer is unacceptable, or None when it is fine"""
+        if not isinstance(result, dict):
+            return "answer is not a JSON object"
+        missing = [key for key in required if result.get(key) is None]
+        if missing:
+            return f"missing {', '.join(missing)}"
+        if validate and not validate(result):
+            return "failed validation"
+        if confidence:
+            score = confidence(result)
+            if score is not None and score < self.min_confidence:
+                return f"low confidence {score:.2f}"
+        return None
+
+    def _attempt(self, task, tier, payload, timeout, escalated):
+        started = time.monotonic()
+        usage = {}
+        try:
+            body = self.client.chat(dict(payload, model=self.tiers[tier]), timeout=timeout, label=f"{task}/{tier}")
+            usage = body.get("usage", {})
+            content = body["choices"][0]["message"]["content"]
+            try:
+                result = json.loads(content)
+            except ValueError:
+                result = extract_json(content)
+        except ValueError as e:
+            self._record(tier, time.monotonic() - started, usage, False, escalated)
+            raise InvalidCompletion(f"unparseable JSON: {e}")
+        except Exception:
+            self._record(tier, time.monotonic() - started, usage, False, escalated)
+            raise
+        self._record(tier, time.monotonic() - started, usage, True, escalated)
+        return result
+
+    def chat_json(self, task, payload, timeout=30, required=(), validate=None, confidence=None):
+        """JSON answer for a task from the cheapest tier that produces an acceptable one"""
+        tier = self.tier_for(task)
+        deadline = time.monotonic() + timeout
+        try:
+            result = self._attempt(task, tier, payload, timeout, False)
+            problem = self.check(result, required, validate, confidence)
+        except InvalidCompletion as e:
+            result, problem = None, str(e)
+        return self._settle(task, tier, payload, result, problem, deadline, required, validate)
+
+    def stream_chat(self, task, payload, timeout=30):
+        """Stream a task's completion from its tier, yielding content deltas
+
+        The call is counted in the tier stats like any other attempt; pass the
+        joined text to parse_streamed() to check it.
+        """
+        tier = self.tier_for(task)
+        usage = {}
+        started = time.monotonic()
+        ok = False
+        try:
+            yield from self.client.stream_chat(
+                dict(payload, model=self.tiers[tier]), timeout=timeout, label=f"{task}/{tier}", usage_sink=usage
+            )
+            ok = True
+        finally:
+            self._record(tier, time.monotonic() - started, usage, ok)
+
+    def parse_streamed(self, task, content, payload, timeout=30, required=(), validate=None, confidence=None):
+        """chat_json()'s checks for text streamed by stream_chat(), escalating with payload when it falls short"""
+        try:
+            try:
+                result = json.loads(content)
+            except ValueError:
+                result = extract_json(content)
+            problem = self.check(result, required, validate, confidence)
+        except ValueError as e:
+            result, problem = None, f"unparseable JSON: {e}"
+        return self._settle(task, self.tier_for(task), payload, result, problem, time.monotonic() + timeout,
+                            required, validate)
+
+    def _settle(self, task, tier, payload, result, problem, deadline, required, validate):
+        if problem is None:
+            return result
+        if tier == self.escalate_to:
+            raise InvalidCompletion(f"{task}: {problem}")
+
+        print(f" Escalating {task} from {tier} to {self.escalate_to}: {problem}")
+        remaining = max(1.0, deadline - time.monotonic())
+        result = self._attempt(task, self.escalate_to, payload, remaining, True)
+        problem = self.check(result, required, validate)
+        if problem is not None:
+            raise InvalidCompletion(f"{task}: {problem}")
+        return result
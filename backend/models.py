@@ -30,4 +30,39 @@ class User(db.Model):
         }
     
     def __repr__(self):
-        return f'<User {self.email}>'
\ No newline at end of file
+        return f'<User {self.email}>'
+
+
+class Checkin(db.Model):
+    __tablename__ = 'checkins'
+    __table_args__ = (
+        db.Index('ix_checkins_user_type_time', 'user_id', 'checkin_type', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    uid = db.Column(db.String(32), unique=True, nullable=False)
+    user_id = db.Column(db.String(120), nullable=False)
+    checkin_type = db.Column(db.String(20), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.JSON, nullable=False, default=dict)
+    stress = db.Column(db.Integer)
+    energy = db.Column(db.Integer)
+    mood = db.Column(db.Integer)
+    focus = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            'id': self.uid,
+            'timestamp': self.timestamp.isoformat(),
+            'type': self.checkin_type,
+            'data': self.data,
+            'signals': {
+                'stress': self.stress,
+                'energy': self.energy,
+                'mood': self.mood,
+                'focus': self.focus
+            }
+        }
+
+    def __repr__(self):
+        return f'<Checkin {self.user_id} {self.checkin_type} {self.timestamp}>'
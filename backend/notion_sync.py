@@ -0,0 +1,145 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import requests
+
+NOTION_API_URL = "https://api.notion.com/v1"
+NOTION_PAGE_SIZE = 100
+# Incremental queries cannot see archived or deleted pages, so a full
+# resync runs at least this often to drop them from the local cache.
+NOTION_FULL_SYNC_SECONDS = 3600
+DONE_STATUSES = ("Done", "Completed", "Finished")
+# Full syncs fetch tasks due up to this far past the window, so the window
+# can slide for a day before a new full sync is needed.
+WINDOW_SLACK = timedelta(days=1)
+
+
+def parse_notion_page(page):
+    props = page.get("properties", {})
+    return {
+        "id": page.get("id"),
+        "name": props.get("Name", {}).get("title", [{}])[0].get("plain_text", "Untitled") if props.get("Name", {}).get("title") else "Untitled",
+        "due_date": props.get("Due date", {}).get("date", {}).get("start") if props.get("Due date", {}).get("date") else None,
+        "priority": props.get("Priority Level", {}).get("select", {}).get("name") if props.get("Priority Level", {}).get("select") else None,
+        "status": props.get("Status", {}).get("status", {}).get("name") if props.get("Status", {}).get("status") else None,
+        "type": props.get("Type", {}).get("rich_text", [{}])[0].get("plain_text") if props.get("Type", {}).get("rich_text") else None
+    }
+
+
+def relevance_filter(horizon, done_statuses=DONE_STATUSES):
+    """Notion filter for open tasks that have a due date on or before horizon"""
+    return {"and": [
+        *({"property": "Status", "status": {"does_not_equal": name}} for name in done_statuses),
+        {"property": "Due date", "date": {"is_not_empty": True}},
+        {"property": "Due date", "date": {"on_or_before": horizon.isoformat()}}
+    ]}
+
+
+def parse_due(due_date):
+    due = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
+    if due.tzinfo is None:
+        due = due.astimezone()
+    return due
+
+
+def iter_notion_pages(database_id, headers, body=None, session=requests, base_url=NOTION_API_URL):
+    """Yield every page of a database query, following has_more/next_cursor"""
+    body = dict(body or {}, page_size=NOTION_PAGE_SIZE)
+    while True:
+        response = session.post(
+            f"{base_url}/databases/{database_id}/query",
+            headers=headers, json=body, timeout=10
+        )
+        response.raise_for_status()
+        data = response.json()
+        for page in data.get("results", []):
+            yield page
+        if not data.get("has_more") or not data.get("next_cursor"):
+            break
+        body["start_cursor"] = data["next_cursor"]
+
+
+class NotionTaskStore:
+    """Local cache of one Notion database's open, soon-due tasks, refreshed by last_edited_time"""
+
+    def __init__(self, database_id, window_days=7, done_statuses=DONE_STATUSES):
+        self.database_id = database_id
+        self.window_days = window_days
+        self.done_statuses = tuple(done_statuses)
+        self.done_lower = {name.lower() for name in self.done_statuses}
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.cursor = None
+        self.horizon = None
+        self.last_full_sync = 0
+        self.version = 0
+
+    def is_relevant(self, task, horizon):
+        if (task.get("status") or "").lower() in self.done_lower or not task.get("due_date"):
+            return False
+        try:
+            return parse_due(task["due_date"]) <= horizon
+        except ValueError:
+            return False
+
+    def list_all(self, headers, session=requests, base_url=NOTION_API_URL):
+        """Every task in the database, done and undated ones included, straight from Notion
+
+        This bypasses the cache, which only holds the tasks relevant to stress analysis.
+        """
+        body = {"sorts": [{"property": "Due date", "direction": "ascending"}]}
+        return [
+            parse_notion_page(page)
+            for page in iter_notion_pages(self.database_id, headers, body, session, base_url)
+            if not page.get("archived") and not page.get("in_trash")
+        ]
+
+    def sync(self, headers, session=requests, base_url=NOTION_API_URL):
+        """Fetch pages edited since the last sync (or every relevant page on a full sync)"""
+        with self.lock:
+            now = datetime.now(timezone.utc)
+            full = (
+                self.cursor is None
+                or self.horizon is None
+                or now + timedelta(days=self.window_days) > self.horizon
+                or time.time() - self.last_full_sync > NOTION_FULL_SYNC_SECONDS
+            )
+            horizon = self.horizon
+            if full:
+                horizon = now + timedelta(days=self.window_days) + WINDOW_SLACK
+                body = {
+                    "filter": relevance_filter(horizon, self.done_statuses),
+                    "sorts": [{"property": "Due date", "direction": "ascending"}]
+                }
+            else:
+                # Edits can make a cached task irrelevant, so this filter is not narrowed further.
+                # last_edited_time is rounded to the minute, so re-read the cursor's minute too
+                body = {"filter": {
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {"on_or_after": self.cursor}
+                }}
+
+            tasks = {} if full else dict(self.tasks)
+            cursor = self.cursor
+            changed = 0
+            for page in iter_notion_pages(self.database_id, headers, body, session, base_url):
+                page_id = page.get("id")
+                task = parse_notion_page(page)
+                if page.get("archived") or page.get("in_trash") or not self.is_relevant(task, horizon):
+                    changed += tasks.pop(page_id, None) is not None
+                else:
+                    changed += tasks.get(page_id) != task
+                    tasks[page_id] = task
+                edited = page.get("last_edited_time")
+                if edited and (cursor is None or edited > cursor):
+                    cursor = edited
+
+            self.tasks = tasks
+            self.cursor = cursor or now.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            if full:
+                self.horizon = horizon
+                self.last_full_sync = time.time()
+            if changed or full:
+                self.version += 1
+            print(f"Notion {'full' if full else 'incremental'} sync: {changed} changed tasks")
+            return sorted(tasks.values(), key=lambda task: task["due_date"])
@@ -0,0 +1,87 @@
+import time
+
+# Every knob the rule-based stress score uses; override any subset via StressScorer(weights)
+DEFAULT_WEIGHTS = {
+    "base": 1,
+    # (max relevant tasks, points); more tasks than the last band earn task_overflow
+    "task_bands": [(5, 1), (10, 2), (15, 3)],
+    "task_overflow": 4,
+    "overdue_each": 1.5,
+    "overdue_cap": 3,
+    "urgent_each": 1,
+    "urgent_cap": 2,
+    # (min events, points), checked in order
+    "event_bands": [(20, 2), (10, 1)],
+    "back_to_back_threshold": 5,
+    "back_to_back_points": 1
+}
+
+STRESS_LEVELS = [
+    (2, "minimal"),
+    (4, "low"),
+    (6, "moderate"),
+    (8, "high"),
+    (9, "severe"),
+    (10, "critical")
+]
+
+
+def stress_level_for(score):
+    for max_score, level in STRESS_LEVELS:
+        if score <= max_score:
+            return level
+    return "critical"
+
+
+class StressScorer:
+    """Deterministic stress score from calendar and task metrics, cheap enough for every request"""
+
+    def __init__(self, weights=None):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+
+    def points(self, cal_analysis, task_analysis):
+        w = self.weights
+        score = w["base"]
+        relevant = task_analysis['relevant']
+        for limit, points in w["task_bands"]:
+            if relevant <= limit:
+                score += points
+                break
+        else:
+            score += w["task_overflow"]
+        score += min(task_analysis['overdue_count'] * w["overdue_each"], w["overdue_cap"])
+        score += min(task_analysis['urgent_count'] * w["urgent_each"], w["urgent_cap"])
+        for threshold, points in w["event_bands"]:
+            if cal_analysis['total_events'] >= threshold:
+                score += points
+                break
+        if cal_analysis['back_to_back'] >= w["back_to_back_threshold"]:
+            score += w["back_to_back_points"]
+        return max(1, min(int(score), 10))
+
+    def score(self, cal_analysis, task_analysis):
+        """Analysis dict in the same shape as the AI assessment"""
+        started = time.perf_counter()
+        stress_score = self.points(cal_analysis, task_analysis)
+        return {
+            "stress_level": stress_level_for(stress_score),
+            "stress_score": stress_score,
+            "burnout_risk": "high" if stress_score >= 8 else "moderate" if stress_score >= 5 else "low",
+            "mood_state": "overwhelmed" if stress_score >= 9 else "stressed" if stress_score >= 7 else "coping" if stress_score >= 5 else "balanced",
+            "energy_forecast": "depleted" if stress_score >= 9 else "low" if stress_score >= 7 else "moderate" if stress_score >= 5 else "stable",
+            "key_patterns": [
+                f"{task_analysis['relevant']} tasks in next {task_analysis['window_days']} days",
+                f"{cal_analysis['total_events']} calendar events"
+            ],
+            "wellness_recommendations": [
+                {"action": "Review task priorities", "priority": "high" if task_analysis['overdue_count'] > 2 else "medium", "reasoning": f"{task_analysis['overdue_count']} overdue tasks"}
+            ],
+            "recommended_music_genres": ["chill", "ambient", "lo-fi"],
+            "detailed_assessment": f"Based on {task_analysis['relevant']} relevant tasks (next {task_analysis['window_days']} days) and {cal_analysis['total_events']} events. {task_analysis['overdue_count']} overdue, {task_analysis['urgent_count']} urgent.",
+            "source": "rules",
+            "scoring_ms": round((time.perf_counter() - started) * 1000, 3),
+            "raw_metrics": {
+                "calendar": cal_analysis,
+                "tasks": task_analysis
+            }
+        }
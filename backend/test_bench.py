@@ -0,0 +1,17 @@
+from bench import percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile(values, 0) == 1
+
+
+def test_percentile_small_samples():
+    values = list(range(1, 21))
+    assert percentile(values, 95) == 19
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) == 0.0
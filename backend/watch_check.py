@@ -0,0 +1,171 @@
+"""End-to-end check of the calendar watch channel and webhook path.
+
+Starts the fake calendar and Groq from fake_upstreams.py, serves app.py
+in-process from a scratch directory and, for two users, registers a watch
+channel pointing at /calendar/webhook. It then pushes a change to one
+channel only and checks that:
+
+- only that user's calendar mirror is marked dirty and only that user's
+  stress snapshot is dropped,
+- the next /calendar read for that user runs a delta sync that picks up the
+  new event, while the other user's mirror is left alone,
+- pushes with a wrong channel token or an unknown channel id get a 404,
+- the webhook address always comes from CALENDAR_WEBHOOK_URL, and channels
+  replaced by a re-watch, stopped, or owned by an evicted client stop routing.
+
+    python watch_check.py
+
+Exits non-zero when any check fails.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+from fake_upstreams import FakeCalendar, FakeGroq, fake_env, write_fake_token
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, ok, label):
+        print(f"{'PASS' if ok else 'FAIL'}  {label}")
+        self.failed += 0 if ok else 1
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def serve(app, port):
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    calendar = FakeCalendar().start()
+    groq = FakeGroq().start()
+    now = datetime.now(timezone.utc)
+    calendar.add_event("Planning", now + timedelta(hours=2), notify=False)
+
+    workdir = tempfile.mkdtemp(prefix="zenschedule-watch-")
+    os.chdir(workdir)
+    write_fake_token(os.path.join(workdir, 'token_calendar.json'))
+    # The app reads its webhook address at import, so the port is chosen first
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    os.environ.update(
+        CALENDAR_WEBHOOK_URL=f"{base_url}/calendar/webhook",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'watch.db')}",
+        SECRET_KEY='watch-check', GROQ_API_KEY='fake',
+        **fake_env('calendar', calendar.url), **fake_env('groq', groq.url)
+    )
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from auth import issue_token
+    from integrations import DEFAULT_USER
+    from models import db, User
+
+    with open(os.path.join(workdir, 'token_calendar.json')) as token:
+        token_info = token.read()
+    with backend.app.app_context():
+        user = User(email="watch@example.com", password=generate_password_hash("watch"),
+                    google_calendar_token=token_info)
+        db.session.add(user)
+        db.session.commit()
+        other = str(user.id)
+        bearer = {"Authorization": f"Bearer {issue_token(user)}"}
+
+    server = serve(backend.app, port)
+    checks = Checks()
+    users = {DEFAULT_USER: {}, other: bearer}
+    try:
+        channels = {}
+        for user_id, headers in users.items():
+            watch = requests.post(f"{base_url}/calendar/watch", headers=headers,
+                                  json={"address": "http://attacker.invalid/hook"}, timeout=10).json()
+            checks.expect(watch.get("success"), f"watch channel registered for {user_id}")
+            channels[user_id] = watch.get("channel_id")
+            checks.expect(calendar.channels.get(channels[user_id], {}).get("address") == f"{base_url}/calendar/webhook",
+                          f"{user_id}'s channel posts to the configured webhook, not the body's address")
+            requests.get(f"{base_url}/calendar", headers=headers, timeout=10)
+            requests.get(f"{base_url}/analyze", headers=headers, timeout=30)
+
+        stores = {user_id: backend.get_calendar_store(user_id) for user_id in users}
+        snapshots = {user_id: backend.wellness_snapshots.get(user_id) for user_id in users}
+        synced = {user_id: stores[user_id].last_sync for user_id in users}
+        for user_id in users:
+            checks.expect(not stores[user_id].dirty and snapshots[user_id] is not None,
+                          f"{user_id} starts with a clean mirror and a cached snapshot")
+
+        calendar.add_event("Incident review", now + timedelta(hours=4), notify=False)
+        calendar.notify(channel_ids={channels[DEFAULT_USER]})
+
+        checks.expect(stores[DEFAULT_USER].dirty, "push marks the notified user's mirror dirty")
+        checks.expect(backend.wellness_snapshots.get(DEFAULT_USER) is None,
+                      "push drops the notified user's stress snapshot")
+        checks.expect(not stores[other].dirty, "push leaves the other user's mirror clean")
+        checks.expect(backend.wellness_snapshots.get(other) is snapshots[other],
+                      "push keeps the other user's stress snapshot")
+
+        token_before = stores[DEFAULT_USER].sync_token
+        horizon_before = stores[DEFAULT_USER].horizon
+        events = requests.get(f"{base_url}/calendar", timeout=10).json().get("events", [])
+        checks.expect(any(event["summary"] == "Incident review" for event in events),
+                      "next read returns the pushed event")
+        # A full sync would have reset the mirror and moved its horizon
+        checks.expect(stores[DEFAULT_USER].sync_token != token_before and stores[DEFAULT_USER].horizon == horizon_before,
+                      "next read ran a delta sync from the stored sync token")
+        requests.get(f"{base_url}/calendar", headers=bearer, timeout=10)
+        checks.expect(stores[other].last_sync == synced[other], "the other user's mirror was not re-synced")
+
+        bad_token = requests.post(f"{base_url}/calendar/webhook", headers={
+            'X-Goog-Channel-ID': channels[DEFAULT_USER],
+            'X-Goog-Channel-Token': 'not-the-token',
+            'X-Goog-Resource-State': 'exists'
+        }, timeout=10)
+        checks.expect(bad_token.status_code == 404, "push with a wrong channel token is rejected with 404")
+        unknown = requests.post(f"{base_url}/calendar/webhook", headers={
+            'X-Goog-Channel-ID': 'no-such-channel',
+            'X-Goog-Resource-State': 'exists'
+        }, timeout=10)
+        checks.expect(unknown.status_code == 404, "push for an unknown channel is rejected with 404")
+
+        def push(channel_id):
+            return requests.post(f"{base_url}/calendar/webhook", headers={
+                'X-Goog-Channel-ID': channel_id, 'X-Goog-Resource-State': 'exists'
+            }, timeout=10).status_code
+
+        old_channel = channels[DEFAULT_USER]
+        rewatch = requests.post(f"{base_url}/calendar/watch", timeout=10).json()
+        checks.expect(rewatch.get("success") and backend.integrations.channel_user(old_channel) is None
+                      and push(old_channel) == 404, "a re-watch unmaps the replaced channel")
+        requests.delete(f"{base_url}/calendar/watch", timeout=10)
+        checks.expect(backend.integrations.channel_user(rewatch.get("channel_id")) is None,
+                      "stopping the watch unmaps its channel")
+        backend.integrations.forget(other, providers=('calendar',))
+        checks.expect(backend.integrations.channel_user(channels[other]) is None and push(channels[other]) == 404,
+                      "evicting a user's calendar client unmaps its channel")
+        checks.expect(not backend.integrations.channels, "no channel mappings are left behind")
+    finally:
+        server.shutdown()
+        calendar.stop()
+        groq.stop()
+
+    print(json.dumps({"failed": checks.failed}))
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -68,4 +68,4 @@ class ApiService {
 const api = new ApiService();
 
 export default api;
-export { api };
+export { api, BASE_URL };
@@ -1,5 +1,22 @@
 import api from './api';
 
+// The backend answers check-ins with 202 and runs the mood analysis as a job;
+// stay under the client's 10s request timeout while waiting for it.
+const MOOD_ANALYSIS_WAIT_SECONDS = 8;
+
+async function withMoodAnalysis(response: any): Promise<any> {
+  if (response?.mood_analysis || !response?.job?.id) {
+    return response;
+  }
+  try {
+    const { job } = await api.get<any>(`/jobs/${response.job.id}`, { wait: MOOD_ANALYSIS_WAIT_SECONDS });
+    return job?.status === 'done' ? { ...response, mood_analysis: job.result } : response;
+  } catch (error) {
+    console.error(' Mood analysis unavailable:', error);
+    return response;
+  }
+}
+
 export const checkinService = {
   async submitMorningCheckin(data: {
     mood: number;
@@ -9,10 +26,11 @@ export const checkinService = {
     notes: string;
     goals: string[];
   }): Promise<any> {
-    return api.post('/checkin/morning', {
+    const response = await api.post('/checkin/morning', {
       ...data,
       user_id: 'default_user',
     });
+    return withMoodAnalysis(response);
   },
 
   async submitEveningCheckin(data: {
@@ -24,10 +42,11 @@ export const checkinService = {
     gratitude: string[];
     goals_achieved: boolean;
   }): Promise<any> {
-    return api.post('/checkin/evening', {
+    const response = await api.post('/checkin/evening', {
       ...data,
       user_id: 'default_user',
     });
+    return withMoodAnalysis(response);
   },
 
   async submitAfternoonCheckin(data: {
@@ -1,4 +1,4 @@
-import { api } from './api';
+import { api, BASE_URL } from './api';
 export interface SpotifyTrack {
   name: string;
   artist: string;
@@ -59,19 +59,9 @@ export const spotifyService = {
   },
 
   async getLoginUrl(): Promise<string> {
-    try {
-      const response = await fetch(`${api}/spotify-login`);
-      const data = await response.json();
-      
-      if (!data.success || !data.auth_url) {
-        throw new Error(data.error || 'Failed to get login URL');
-      }
-      
-      return data.auth_url;
-    } catch (error) {
-      console.error('Spotify login URL error:', error);
-      throw error;
-    }
+    // Opened in the browser so the login session that owns the OAuth state
+    // lives in the same cookie jar as the Spotify callback
+    return `${BASE_URL}/spotify-login?redirect=true`;
   },
 
   async getMusicTherapy(mood?: string): Promise<MusicTherapyResponse> {